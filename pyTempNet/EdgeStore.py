@@ -0,0 +1,570 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 09:12:51 2026
+
+(c) Copyright ETH Zürich, Chair of Systems Design, 2015-2016
+"""
+
+import os
+import shutil
+import tempfile
+import itertools
+import numpy as np
+import multiprocessing
+from array import array
+from collections import defaultdict
+
+from pyTempNet.Log import *
+
+
+class EdgeStore:
+    """A compact, column-oriented storage for time-stamped edges. Node names are
+    interned to contiguous integer ids (in the order of their first appearance),
+    and the sources, targets and time stamps of all edges are stored in numpy arrays
+    which are sorted by time stamps. Index structures which allow to efficiently
+    access all edges active at a given time or all edges starting (ending) at a
+    given node are generated on demand as CSR-style offset arrays."""
+
+    def __init__(self, tedges=None, nodes=None):
+        """Constructor generating an edge store instance
+
+        @param tedges: an optional iterable of (possibly unordered) time-stamped
+            edges (v,w,t) from which to construct the edge store
+        @param nodes: an optional list of node names. If given, node ids will be assigned
+            in the order of this list, and nodes not contained in the list will be appended
+        """
+
+        # The list of node names, indexed by node ids
+        self.names = []
+
+        # A dictionary mapping node names to node ids
+        self.ids = {}
+
+        if nodes is not None:
+            for v in nodes:
+                self.getNodeId(v)
+
+        # The sources, targets and time stamps of all edges, ordered by time stamps
+        self.sources = np.zeros(0, dtype=np.int32)
+        self.targets = np.zeros(0, dtype=np.int32)
+        self.times = np.zeros(0, dtype=np.int64)
+
+        # Cached index structures which are generated on demand
+        self.index = {}
+
+        # Preallocated arrays used to append edges (see addEdges)
+        self.buffer = None
+
+        if tedges is not None:
+            self.setEdges(*self.internEdges(tedges))
+
+
+    def internEdges(self, tedges):
+        """Assigns node ids to the nodes of time-stamped edges, and returns a tuple of 
+        arrays (sources, targets, times) of the edges, in the order of tedges. New nodes 
+        are added to the store, while the edges are not.
+
+        @param tedges: an iterable of time-stamped edges (v,w,t)
+        """
+        src = array('i')
+        tgt = array('i')
+        ts = array('q')
+        ids = self.ids
+        for e in tedges:
+            s = ids.get(e[0])
+            if s is None:
+                s = self.getNodeId(e[0])
+            d = ids.get(e[1])
+            if d is None:
+                d = self.getNodeId(e[1])
+            src.append(s)
+            tgt.append(d)
+            try:
+                ts.append(e[2])
+            except TypeError:
+                # Non-integer time stamps are stored as floats
+                ts = array('d', ts)
+                ts.append(e[2])
+        return (np.frombuffer(src, dtype=np.int32), np.frombuffer(tgt, dtype=np.int32),
+            np.frombuffer(ts, dtype=ts.typecode))
+
+
+    @staticmethod
+    def fromArrays(sources, targets, times, names):
+        """Generates an edge store from arrays of integer node ids, and a list of
+        node names which maps node ids to names.
+
+        @param sources: array of integer ids of source nodes
+        @param targets: array of integer ids of target nodes
+        @param times: array of (possibly unordered) time stamps
+        @param names: list of node names, indexed by node ids
+        """
+        store = EdgeStore()
+        store.names = list(names)
+        store.ids = dict( (v, i) for i, v in enumerate(store.names) )
+        store.setEdges(sources, targets, times)
+        return store
+
+
+    @staticmethod
+    def fromEdges(tedges, chunk_size=2**22, path=None, tmpdir=None):
+        """Generates an edge store from an iterable of time-stamped edges (v,w,t), e.g. as 
+        generated by Utilities.iterEdges, which is consumed in chunks of chunk_size edges. Each 
+        chunk is sorted by time stamps and, if there is more than one chunk, spilled to a temporary 
+        file. The sorted runs are then merged (see mergeSortedRuns), such that no more than about 
+        chunk_size edges of the input are kept in memory in addition to the resulting arrays. 
+        The result is identical to that of the constructor EdgeStore(tedges).
+
+        @param tedges: an iterable of time-stamped edges (v,w,t)
+        @param chunk_size: the number of edges which are read and sorted at once
+        @param path: an optional directory in which the arrays of sources, targets and time stamps 
+            are stored as memory-mapped files sources.npy, targets.npy and times.npy. This allows 
+            to generate edge stores which are larger than the main memory.
+        @param tmpdir: the directory of temporary files (default: the system's temporary directory)
+        """
+        store = EdgeStore()
+        tedges = iter(tedges)
+        runs = []
+        workdir = None
+        try:
+            while True:
+                src, tgt, ts = store.internEdges(itertools.islice(tedges, chunk_size))
+                if len(ts) == 0:
+                    break
+                order = np.argsort(ts, kind='stable')
+                runs.append( (src[order], tgt[order], ts[order]) )
+
+                # Spill sorted runs to disk as soon as there is more than one
+                if len(runs) > 1 or path is not None:
+                    if workdir is None:
+                        workdir = tempfile.mkdtemp(dir=tmpdir)
+                    for i in range(len(runs)):
+                        if not isinstance(runs[i][0], np.memmap):
+                            runs[i] = spillRun(runs[i], os.path.join(workdir, str(i)))
+                    Log.add('Spilled ' + str(len(runs)) + ' sorted runs of time-stamped edges')
+
+            m = sum(len(run[2]) for run in runs)
+            dtype = np.float64 if any(run[2].dtype.kind == 'f' for run in runs) else np.int64
+            if path is None and len(runs) <= 1:
+                store.setEdges(*(runs[0] if len(runs) > 0 else (np.zeros(0), np.zeros(0), np.zeros(0, dtype=dtype))))
+                return store
+
+            if path is None:
+                sources = np.empty(m, dtype=np.int32)
+                targets = np.empty(m, dtype=np.int32)
+                times = np.empty(m, dtype=dtype)
+            else:
+                sources = np.lib.format.open_memmap(os.path.join(path, 'sources.npy'), mode='w+', dtype=np.int32, shape=(m,))
+                targets = np.lib.format.open_memmap(os.path.join(path, 'targets.npy'), mode='w+', dtype=np.int32, shape=(m,))
+                times = np.lib.format.open_memmap(os.path.join(path, 'times.npy'), mode='w+', dtype=dtype, shape=(m,))
+            mergeSortedRuns(runs, sources, targets, times, chunk_size)
+            runs = None
+        finally:
+            if workdir is not None:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        # Runs have been merged in the order of time stamps
+        store.sources = sources
+        store.targets = targets
+        store.times = times
+        return store
+
+
+    def setEdges(self, sources, targets, times):
+        """Replaces all edges in the store by the given arrays of node ids and
+        time stamps, which will be sorted by time stamp. Edges with identical
+        time stamps retain their relative order.
+        """
+        times = np.asarray(times)
+        if times.dtype.kind in 'iub':
+            times = times.astype(np.int64, copy=False)
+        else:
+            times = times.astype(np.float64, copy=False)
+        order = np.argsort(times, kind='stable')
+        self.sources = np.asarray(sources, dtype=np.int32)[order]
+        self.targets = np.asarray(targets, dtype=np.int32)[order]
+        self.times = times[order]
+        self.buffer = None
+        self.index = {}
+
+
+    def addEdges(self, sources, targets, times):
+        """Adds edges given by arrays of node ids and time stamps to the store. If no
+        time stamp is smaller than the latest time stamp in the store, edges are appended
+        in amortized constant time per edge. Otherwise all edges are sorted again.
+        """
+        sources = np.asarray(sources, dtype=np.int32)
+        targets = np.asarray(targets, dtype=np.int32)
+        times = np.asarray(times)
+        if len(times) == 0:
+            return
+
+        m = len(self.times)
+        k = len(times)
+        if (m > 0 and times.min() < self.times[-1]) or (times.dtype.kind == 'f' and self.times.dtype.kind != 'f'):
+            self.setEdges(np.concatenate((self.sources, sources)), np.concatenate((self.targets, targets)),
+                np.concatenate((self.times, times)))
+            return
+
+        order = np.argsort(times, kind='stable')
+
+        # Buffers with spare capacity, of which sources, targets and times are views
+        if self.buffer is None or len(self.buffer[2]) < m + k:
+            capacity = max(2 * (m + k), 16)
+            buffer = (np.zeros(capacity, dtype=np.int32), np.zeros(capacity, dtype=np.int32),
+                np.zeros(capacity, dtype=self.times.dtype))
+            buffer[0][:m] = self.sources
+            buffer[1][:m] = self.targets
+            buffer[2][:m] = self.times
+            self.buffer = buffer
+        src, tgt, ts = self.buffer
+        src[m:m+k] = sources[order]
+        tgt[m:m+k] = targets[order]
+        ts[m:m+k] = times[order]
+        self.sources = src[:m+k]
+        self.targets = tgt[:m+k]
+        self.times = ts[:m+k]
+        self.index = {}
+
+
+    def getNodeId(self, v):
+        """Returns the integer id of node v, assigning a new id if v is not yet known"""
+        i = self.ids.get(v)
+        if i is None:
+            i = len(self.names)
+            self.ids[v] = i
+            self.names.append(v)
+        return i
+
+
+    def vcount(self):
+        """Returns the number of nodes in the edge store"""
+        return len(self.names)
+
+
+    def ecount(self):
+        """Returns the number of time-stamped edges in the edge store"""
+        return len(self.times)
+
+
+    def getTimeIndex(self):
+        """Returns a tuple (ordered_times, ptr), where ordered_times is the sorted array of
+        distinct time stamps, and ptr is an offset array such that the edges at time
+        ordered_times[i] are found at positions ptr[i]:ptr[i+1]."""
+        if 'time' not in self.index:
+            if len(self.times) > 0:
+                starts = np.flatnonzero(np.concatenate(([True], self.times[1:] != self.times[:-1])))
+            else:
+                starts = np.zeros(0, dtype=np.int64)
+            ptr = np.append(starts, len(self.times))
+            self.index['time'] = (self.times[starts], ptr)
+        return self.index['time']
+
+
+    def getNodeIndex(self, mode='OUT'):
+        """Returns a tuple (order, ptr) which indexes edges by source (mode='OUT') or
+        target (mode='IN') node. The positions order[ptr[v]:ptr[v+1]] refer to all
+        edges starting (ending) at node v, ordered by time stamp.
+
+        @param mode: either C{"OUT"} or C{"IN"}
+        """
+        assert mode == 'OUT' or mode == 'IN'
+        if mode not in self.index:
+            nodes = self.sources if mode == 'OUT' else self.targets
+            # A stable sort keeps the edges of each node ordered by time
+            order = np.argsort(nodes, kind='stable')
+            ptr = np.zeros(len(self.names)+1, dtype=np.int64)
+            np.cumsum(np.bincount(nodes, minlength=len(self.names)), out=ptr[1:])
+            self.index[mode] = (order, ptr)
+        return self.index[mode]
+
+
+    def getTEdges(self):
+        """Returns a list of time-stamped edges (v,w,t), ordered by time stamps"""
+        names = self.names
+        return [ (names[s], names[d], t) for s, d, t in
+            zip(self.sources.tolist(), self.targets.tolist(), self.times.tolist()) ]
+
+
+    def getOrderedTimes(self):
+        """Returns an ordered list of all distinct time stamps"""
+        return self.getTimeIndex()[0].tolist()
+
+
+    def getActivities(self):
+        """Returns a dictionary storing, for each node v, the ordered list of
+        time stamps at which links (v,*;t) originate from v"""
+        activities = defaultdict( lambda: list() )
+        order, ptr = self.getNodeIndex('OUT')
+        out_times = self.times[order]
+        for v in range(len(self.names)):
+            if ptr[v+1] > ptr[v]:
+                activities[self.names[v]] = np.unique(out_times[ptr[v]:ptr[v+1]]).tolist()
+        return activities
+
+
+    def getTimeDict(self, tedges):
+        """Returns a dictionary storing all time-stamped links, indexed by time stamps
+
+        @param tedges: the list of time-stamped edges generated by getTEdges
+        """
+        time = defaultdict( lambda: list() )
+        ordered_times, ptr = self.getTimeIndex()
+        for i, t in enumerate(ordered_times.tolist()):
+            time[t] = tedges[ptr[i]:ptr[i+1]]
+        return time
+
+
+    def getNodeDict(self, tedges, mode='OUT'):
+        """Returns a dictionary storing all time-stamped links, indexed by time
+        and source node (mode='OUT') or time and target node (mode='IN')
+
+        @param tedges: the list of time-stamped edges generated by getTEdges
+        @param mode: either C{"OUT"} or C{"IN"}
+        """
+        assert mode == 'OUT' or mode == 'IN'
+        ix = 0 if mode == 'OUT' else 1
+        index = defaultdict( lambda: dict() )
+        for e in tedges:
+            index[e[2]].setdefault(e[ix], []).append(e)
+        return index
+
+
+    def getTwoPaths(self, delta=1, t_from=None, t_to=None, workers=1):
+        """Extracts all time-respecting paths of length two (s,v;t) -> (v,d;t') with
+        t < t' <= t+delta, and returns them as a tuple of numpy arrays (s, v, d, t, t', weight),
+        where s, v and d are node ids. The weight of each two-path is 1/(indeg*outdeg), where indeg
+        is the number of links (*,v;t) and outdeg is the number of links (v,*;t'). Two-paths are
+        ordered in the same way as by the (dictionary-based) extraction in TemporalNetwork.
+
+        @param delta: the maximum time difference between consecutive links
+        @param t_from: if given, only two-paths whose first link has a time stamp t >= t_from are extracted
+        @param t_to: if given, only two-paths whose first link has a time stamp t < t_to are extracted
+        @param workers: the number of processes to use for the extraction. For workers > 1, the 
+            time line is split into chunks which are processed by a pool of processes (see 
+            extractTwoPathArraysParallel). The result is identical to that of the serial extraction.
+        """
+        if workers > 1:
+            return extractTwoPathArraysParallel(self.sources, self.targets, self.times, delta, t_from, t_to, workers)
+        return extractTwoPathArrays(self.sources, self.targets, self.times, delta, t_from, t_to)
+
+
+def spillRun(run, prefix):
+    """Writes a run of edges (sources, targets, times) to files, and returns a tuple 
+    of memory-mapped arrays of the files
+
+    @param run: a tuple of arrays (sources, targets, times)
+    @param prefix: the path prefix of the files
+    """
+    spilled = []
+    for k, x in enumerate(run):
+        filename = prefix + '_' + str(k) + '.npy'
+        np.save(filename, x)
+        spilled.append(np.load(filename, mmap_mode='r'))
+    return tuple(spilled)
+
+
+def mergeSortedRuns(runs, sources, targets, times, chunk_size):
+    """Merges runs of edges sorted by time stamps into the output arrays sources, targets 
+    and times. Edges with identical time stamps are ordered as the runs, and as within runs. 
+    The runs are merged in windows of time stamps, which contain about chunk_size / len(runs) 
+    edges of each run.
+
+    @param runs: a list of tuples of arrays (sources, targets, times), sorted by times
+    @param sources: the output array of source ids
+    @param targets: the output array of target ids
+    @param times: the output array of time stamps
+    @param chunk_size: the number of edges to be merged at once
+    """
+    pos = [ 0 for run in runs ]
+    block = max(1, chunk_size // max(len(runs), 1))
+    k = 0
+    while True:
+        active = [ i for i in range(len(runs)) if pos[i] < len(runs[i][2]) ]
+        if len(active) == 0:
+            break
+
+        # All edges up to the smallest time stamp reached after a block in one of the runs
+        t_max = min(runs[i][2][min(pos[i] + block, len(runs[i][2])) - 1] for i in active)
+        ranges = [ (i, pos[i], np.searchsorted(runs[i][2], t_max, 'right')) for i in active ]
+        src = np.concatenate([ runs[i][0][a:b] for i, a, b in ranges ])
+        tgt = np.concatenate([ runs[i][1][a:b] for i, a, b in ranges ])
+        ts = np.concatenate([ runs[i][2][a:b] for i, a, b in ranges ])
+        order = np.argsort(ts, kind='stable')
+        sources[k:k+len(ts)] = src[order]
+        targets[k:k+len(ts)] = tgt[order]
+        times[k:k+len(ts)] = ts[order]
+        k += len(ts)
+        for i, a, b in ranges:
+            pos[i] = b
+
+
+def extractTwoPathArrays(sources, targets, times, delta=1, t_from=None, t_to=None):
+    """Vectorized extraction of two-paths from arrays of source ids, target ids and
+    (sorted) time stamps of links. See EdgeStore.getTwoPaths for a description of
+    parameters and return values."""
+
+    # Positions of all links (s,v;t) which start a two-path ...
+    lo = 0 if t_from is None else np.searchsorted(times, t_from, 'left')
+    hi = len(times) if t_to is None else np.searchsorted(times, t_to, 'left')
+    if hi <= lo:
+        empty = np.zeros(0, dtype=np.int32)
+        return (empty, empty, empty, times[:0], times[:0], np.zeros(0))
+
+    # ... and of all links (v,d;t') which possibly continue it
+    end = np.searchsorted(times, times[hi-1] + delta, 'right')
+    src = sources[lo:end].astype(np.int64)
+    tgt = targets[lo:end].astype(np.int64)
+    ts = times[lo:end]
+    n_in = hi - lo
+
+    # Rank of time stamps within the considered range of links
+    new_time = np.concatenate(([True], ts[1:] != ts[:-1]))
+    rank = np.cumsum(new_time) - 1
+    u_times = ts[new_time]
+    n_times = len(u_times)
+
+    # Index of all links (v,*;t') ordered by node v and time t'
+    out_key = src * n_times + rank
+    out_order = np.argsort(out_key, kind='stable')
+    out_key = out_key[out_order]
+
+    # Number of links (v,*;t') for all links
+    key_start = np.searchsorted(out_key, out_key, 'left')
+    outdeg = np.searchsorted(out_key, out_key, 'right') - key_start
+
+    # Number of links (*,v;t) and first occurrence of (*,v;t) for all links starting two-paths
+    in_key = tgt[:n_in] * n_times + rank[:n_in]
+    _, first, inverse, counts = np.unique(in_key, return_index=True, return_inverse=True, return_counts=True)
+    indeg = counts[inverse]
+    first = first[inverse]
+
+    # For each link (s,v;t), find the range of links (v,*;t') with t' in (t, t+delta]
+    max_rank = np.searchsorted(u_times, ts[:n_in] + delta, 'right') - 1
+    start = np.searchsorted(out_key, in_key, 'right')
+    stop = np.searchsorted(out_key, tgt[:n_in] * n_times + max_rank, 'right')
+
+    # Combine each link (s,v;t) with all links in the corresponding range
+    n = stop - start
+    i = np.repeat(np.arange(n_in), n)
+    offsets = np.cumsum(n) - n
+    j = start[i] + np.arange(len(i)) - offsets[i]
+    o = out_order[j]
+
+    # Discard two-paths that contain self-loops
+    mask = (src[i] != tgt[i]) & (tgt[i] != tgt[o])
+    i = i[mask]
+    j = j[mask]
+    o = o[mask]
+
+    # Order two-paths by time, middle node, time of second link, first link and second link
+    order = np.lexsort((j, i, rank[o], first[i]))
+    i = i[order]
+    j = j[order]
+    o = o[order]
+
+    weights = 1. / (indeg[i] * outdeg[j]).astype(np.float64)
+
+    return (src[i].astype(np.int32), tgt[i].astype(np.int32), tgt[o].astype(np.int32), ts[i], ts[o], weights)
+
+
+"""Edge arrays which are shared with the worker processes of extractTwoPathArraysParallel"""
+sharedArrays = {}
+
+
+def attachSharedArrays(specs):
+    """Attaches a worker process to the shared memory blocks which hold the edge arrays
+
+    @param specs: a dictionary mapping array names to tuples (shared memory name, dtype, length)
+    """
+    from multiprocessing import shared_memory
+    for key, (name, dtype, n) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        sharedArrays[key] = (shm, np.ndarray(n, dtype=dtype, buffer=shm.buf))
+
+
+def extractTwoPathChunk(chunk):
+    """Extracts all two-paths whose first link lies in a given time range from the
+    shared edge arrays. This function is executed by worker processes.
+
+    @param chunk: a tuple (delta, t_from, t_to)
+    """
+    delta, t_from, t_to = chunk
+    return extractTwoPathArrays(sharedArrays['sources'][1], sharedArrays['targets'][1],
+        sharedArrays['times'][1], delta, t_from, t_to)
+
+
+def extractTwoPathArraysParallel(sources, targets, times, delta=1, t_from=None, t_to=None, workers=2):
+    """Parallel extraction of two-paths from arrays of source ids, target ids and (sorted)
+    time stamps of links. Since two-paths only couple links whose time stamps are at most
+    delta apart, the time line is cut into chunks of consecutive time stamps, and the two-paths
+    starting in each chunk are extracted independently (using all links up to delta after the
+    end of the chunk) by a pool of worker processes. Edge arrays are passed to the workers via
+    shared memory. As chunk boundaries always separate distinct time stamps, the concatenation
+    of the chunks' two-paths is identical to the result of extractTwoPathArrays.
+
+    @param workers: the number of worker processes
+    """
+    from multiprocessing import shared_memory
+
+    lo = 0 if t_from is None else np.searchsorted(times, t_from, 'left')
+    hi = len(times) if t_to is None else np.searchsorted(times, t_to, 'left')
+
+    # Chunk boundaries at time stamps which split the links starting two-paths into equal parts
+    n_chunks = 4 * workers
+    bounds = np.unique(times[lo + (np.arange(1, n_chunks) * (hi - lo)) // n_chunks]) if hi - lo > n_chunks else []
+    bounds = bounds[bounds > times[lo]] if len(bounds) > 0 else bounds
+    if len(bounds) == 0:
+        return extractTwoPathArrays(sources, targets, times, delta, t_from, t_to)
+    chunks = [(delta, a, b) for a, b in zip([t_from] + list(bounds), list(bounds) + [t_to])]
+
+    Log.add('Extracting two-paths in ' + str(len(chunks)) + ' chunks using ' + str(workers) + ' processes ...')
+
+    # Copy edge arrays to shared memory
+    blocks = []
+    specs = {}
+    try:
+        for key, x in (('sources', sources), ('targets', targets), ('times', times)):
+            shm = shared_memory.SharedMemory(create=True, size=max(x.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(len(x), dtype=x.dtype, buffer=shm.buf)[:] = x
+            specs[key] = (shm.name, x.dtype, len(x))
+
+        pool = multiprocessing.Pool(workers, initializer=attachSharedArrays, initargs=(specs,))
+        try:
+            parts = pool.map(extractTwoPathChunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return tuple(np.concatenate([part[k] for part in parts]) for k in range(6))
+
+
+def aggregateTwoPaths(s, v, d, w):
+    """Aggregates the weights of all two-paths with identical nodes (s,v,d). Returns a tuple
+    of numpy arrays (s, v, d, weight) which contains each distinct two-path exactly once,
+    ordered by s, v and d.
+
+    @param s: array of source node ids of two-paths
+    @param v: array of middle node ids of two-paths
+    @param d: array of target node ids of two-paths
+    @param w: array of weights of two-paths
+    """
+    s = np.asarray(s, dtype=np.int32)
+    v = np.asarray(v, dtype=np.int32)
+    d = np.asarray(d, dtype=np.int32)
+    w = np.asarray(w, dtype=np.float64)
+    if len(w) == 0:
+        return (s, v, d, w)
+
+    order = np.lexsort((d, v, s))
+    s = s[order]
+    v = v[order]
+    d = d[order]
+    new = np.concatenate(([True], (s[1:] != s[:-1]) | (v[1:] != v[:-1]) | (d[1:] != d[:-1])))
+    starts = np.flatnonzero(new)
+    return (s[starts], v[starts], d[starts], np.add.reduceat(w[order], starts))
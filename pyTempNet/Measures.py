@@ -10,6 +10,7 @@ import numpy as np
 import scipy.sparse as sparse
 import scipy.sparse.linalg as sla
 import scipy.linalg as la
+import scipy.stats as stats
 
 from collections import defaultdict
 
@@ -31,15 +32,8 @@ def Laplacian(temporalnet, model="SECOND"):
     if (model is "SECOND" or "NULL") == False:
         raise ValueError("model must be one of \"SECOND\" or \"NULL\"")
     
-    if model == "SECOND":
-        network = temporalnet.igraphSecondOrder().components(mode="STRONG").giant()
-    elif model == "NULL": 
-        network = temporalnet.igraphSecondOrderNull().components(mode="STRONG").giant()  
-    
-    T2 = Utilities.RWTransitionMatrix( network )
-    I  = sparse.identity( len(network.vs()) )
-
-    return I-T2
+    # The Laplacian is cached in the temporal network, so we return a copy
+    return temporalnet.getLaplacian(model).copy()
 
 
 def FiedlerVectorSparse(temporalnet, model="SECOND", normalize=True, lanczosVecs=15, maxiter=10):
@@ -70,7 +64,7 @@ def FiedlerVectorSparse(temporalnet, model="SECOND", normalize=True, lanczosVecs
         raise ValueError("model must be one of \"SECOND\" or \"NULL\"")
     
     # NOTE: The transposed matrix is needed to get the "left" eigen vectors
-    L = Laplacian(temporalnet, model)
+    L = temporalnet.getLaplacian(model)
     # NOTE: ncv=lanczosVecs sets additional auxiliary eigenvectors that are computed
     # NOTE: in order to be more confident to find the one with the largest
     # NOTE: magnitude, see
@@ -128,12 +122,7 @@ def AlgebraicConn(temporalnet, model="SECOND"):
     
     Log.add('Calculating algebraic connectivity ... ', Severity.INFO)
 
-    L = Laplacian(temporalnet, model)
-    # NOTE: ncv=13 sets additional auxiliary eigenvectors that are computed
-    # NOTE: in order to be more confident to find the one with the largest
-    # NOTE: magnitude, see
-    # NOTE: https://github.com/scipy/scipy/issues/4987
-    w = sla.eigs( L, which="SM", k=2, ncv=13, return_eigenvectors=False )
+    w = temporalnet.getLaplacianEigenvalues(model)
     evals_sorted = np.sort(np.absolute(w))
 
     Log.add('finished.', Severity.INFO)
@@ -141,10 +130,19 @@ def AlgebraicConn(temporalnet, model="SECOND"):
     return np.abs(evals_sorted[1])
     
     
-def EntropyGrowthRateRatio(t, mode='FIRSTORDER', method='MLE'):
+def EntropyGrowthRateRatio(t, mode='FIRSTORDER', method='MLE', self_loops=True):
     """Computes the ratio between the entropy growth rate ratio between
     the second-order and first-order model of a temporal network t. Ratios smaller
-    than one indicate that the temporal network exhibits non-Markovian characteristics"""
+    than one indicate that the temporal network exhibits non-Markovian characteristics
+    
+    @param t: The temporalnetwork instance to work on
+    @param mode: either C{"FIRSTORDER"} or C{"NULL"}, the model whose entropy growth rate is 
+        used as the denominator
+    @param method: which entropy estimation method to use. The method supports 
+        'Miller' for Miller-corrected MLE or 'MLE' for a naive MLE estimation. 
+    @param self_loops: whether or not self-loops are considered in the number of possible 
+        two-paths, which is used in the Miller correction (see Utilities.countPossibleTwoPaths)
+    """
     
     # NOTE to myself: most of the time here goes into computation of the
     # NOTE            EV of the transition matrix for the bigger of the
@@ -153,13 +151,14 @@ def EntropyGrowthRateRatio(t, mode='FIRSTORDER', method='MLE'):
     assert method == 'MLE' or method=='Miller'
     
     # Generate strongly connected component of second-order network
-    g2 = t.igraphSecondOrder().components(mode="STRONG").giant()       
+    g2 = t.getGiantComponent('SECOND')
     
     Log.add('Calculating entropy growth rate ratio ... ', Severity.INFO)
     
     # Compute entropy growth rate of observed transition matrix
-    T2 = Utilities.RWTransitionMatrix(g2)
-    T2_pi = Utilities.StationaryDistribution(T2)
+    # (the cached transition matrix is copied as it is modified below)
+    T2 = t.getTransitionMatrix('SECOND').copy()
+    T2_pi = t.getStationaryDistribution('SECOND')
 
     T2.data *=  np.log2(T2.data)    
 
@@ -167,14 +166,16 @@ def EntropyGrowthRateRatio(t, mode='FIRSTORDER', method='MLE'):
     if method == 'Miller':
         # K is the number of possible two-paths that can exist based on the 
         # time-stamped edge sequence (or observed two paths)
-        if len(t.tedges)>0:
-            edges = set((e[0], e[1]) for e in t.tedges)
+        if t.ecount()>0:
+            store = t.getEdgeStore()
+            n = store.vcount()
+            keys = np.unique(store.sources.astype(np.int64) * n + store.targets)
+            edges = zip((keys // n).tolist(), (keys % n).tolist())
         else:
             edges = [(tp[0], tp[1]) for tp in t.twopaths]
             for tp in t.twopaths:
                 edges.append((tp[1], tp[2]))
-            edges = set(edges)
-        K = len(Utilities.getPossibleTwoPaths(edges))
+        K = Utilities.countPossibleTwoPaths(edges, self_loops)
         #print('K = ', K)
         # N is the number of observations used to estimate the transition probabilities
         # in the second-order network. This corresponds to the total link weight in the 
@@ -190,14 +191,14 @@ def EntropyGrowthRateRatio(t, mode='FIRSTORDER', method='MLE'):
 
     # Compute entropy rate of null model
     if mode == 'FIRSTORDER':
-        g2n = t.igraphFirstOrder().components(mode="STRONG").giant()
+        model = 'FIRSTORDER'
     else:
-        g2n = t.igraphSecondOrderNull().components(mode="STRONG").giant()
+        model = 'NULL'
 
     # For the entropy rate of the null model, no Miller correction is needed
     # since we assume that transitions correspond to the true probabilities
-    T2n = Utilities.RWTransitionMatrix(g2n)
-    T2n_pi = Utilities.StationaryDistribution(T2n)
+    T2n = t.getTransitionMatrix(model).copy()
+    T2n_pi = t.getStationaryDistribution(model)
     T2n.data *=  np.log2(T2n.data)
     H2n = -np.sum( T2n * T2n_pi )
     H2n = np.absolute(H2n)
@@ -208,64 +209,175 @@ def EntropyGrowthRateRatio(t, mode='FIRSTORDER', method='MLE'):
     return H2/H2n
 
 
-def BWPrefMatrix(t, v):
-    """Computes a betweenness preference matrix for a node v in a temporal network t
+def BWPrefMatrix(t, v, sparse_matrix=False):
+    """Computes a betweenness preference matrix for a node v in a temporal network t. Rows 
+    and columns correspond to the distinct predecessors and successors of v in two-paths, 
+    in the order of their first occurrence.
     
     @param t: The temporalnetwork instance to work on
     @param v: Name of the node to compute its BetweennessPreference
+    @param sparse_matrix: whether to return a sparse (CSR) matrix rather than a dense numpy array. 
+        This avoids the allocation of a dense matrix for hub nodes with many predecessors and successors.
     """
     g = t.igraphFirstOrder()
 
     # NOTE: this might raise a ValueError if vertex v is not found
     v_vertex = g.vs.find(name=v)
 
-    # get all distinct predecessors of two paths through v
-    tp_preds = [] 
-    for time in t.twopathsByNode[v]:
-        for tp in t.twopathsByNode[v][time]:
-            tp_preds.append(tp[0])
-    tp_preds = set(tp_preds)
+    index_succ = {}
+    index_pred = {}
+    row = []
+    col = []
+    data = []
 
-    # get all distinct successors of two paths through v
-    tp_succs = [] 
+    # Calculate entries of betweenness preference matrix, and create an index-to-node 
+    # mapping for all distinct predecessors and successors of two paths through v
     for time in t.twopathsByNode[v]:
+        c = 1. / float(len(t.twopathsByNode[v][time]))
         for tp in t.twopathsByNode[v][time]:
-            tp_succs.append(tp[2])
-    tp_succs = set(tp_succs)
-
-    index_succ = {}
-    index_pred = {}
+            row.append(index_pred.setdefault(tp[0], len(index_pred)))
+            col.append(index_succ.setdefault(tp[2], len(index_succ)))
+            data.append(c)
     
-    B_v = np.zeros(shape=(len(tp_preds), len(tp_succs)))
-        
-    # Create an index-to-node mapping for predecessors and successors
-    i = 0
-    for u in tp_preds:
-        index_pred[u] = i
-        i = i+1
+    # Duplicate entries are summed up
+    B_v = sparse.coo_matrix((data, (row, col)), shape=(len(index_pred), len(index_succ))).tocsr()
+    if sparse_matrix:
+        return B_v
+    return B_v.toarray()
+
+
+def BWPrefMatrices(t):
+    """Computes the betweenness preference matrices of all nodes in a temporal network t 
+    in a single pass over all two-paths. Returns a tuple of numpy arrays (v, s, d, b), which 
+    contains one entry b = B_v[s,d] > 0 for each non-zero element of the betweenness preference 
+    matrix B_v of each node v (see BWPrefMatrix), where v, s and d are indices of nodes in the 
+    first-order aggregate network. Entries are ordered by v, s and d, i.e. the matrix of each 
+    node v is a contiguous block.
     
-    i = 0
-    for w in tp_succs:
-        index_succ[w] = i
-        i = i+1
+    @param t: The temporalnetwork instance to work on
+    """
+    n = len(t.nodes)
 
-    # Calculate entries of betweenness preference matrix
-    for time in t.twopathsByNode[v]:
-        for tp in t.twopathsByNode[v][time]:
-            B_v[index_pred[tp[0]], index_succ[tp[2]]] += (1. / float(len(t.twopathsByNode[v][time])))
+    if t.ecount() > 0:
+        # Arrays of all two-paths (s,v;t) -> (v,d;t')
+        tp_s, tp_v, tp_d, tp_t, _, _ = t.getTwoPathArrays()
+    else:
+        # Temporal network has been constructed from two-paths, each of 
+        # which has its own time stamp
+        index = dict( (v, i) for i, v in enumerate(t.nodes) )
+        tp_s = np.array([index[tp[0]] for tp in t.twopaths], dtype=int)
+        tp_v = np.array([index[tp[1]] for tp in t.twopaths], dtype=int)
+        tp_d = np.array([index[tp[2]] for tp in t.twopaths], dtype=int)
+        tp_t = np.arange(len(t.twopaths))
+
+    if len(tp_s) == 0:
+        empty = np.zeros(0, dtype=int)
+        return (empty, empty, empty, np.zeros(0))
+
+    # Each two-path through v which starts at time t contributes 1/N_v(t) to B_v, 
+    # where N_v(t) is the number of two-paths through v starting at time t. 
+    # Note that two-paths are ordered by time.
+    rank = np.concatenate(([0], np.cumsum(tp_t[1:] != tp_t[:-1])))
+    _, inverse, counts = np.unique(tp_v.astype(np.int64) * (rank[-1]+1) + rank, return_inverse=True, return_counts=True)
+    c = 1. / counts[inverse.reshape(-1)]
+
+    # Aggregate contributions of two-paths with the same (v, s, d)
+    keys, inverse = np.unique((tp_v.astype(np.int64) * n + tp_s) * n + tp_d, return_inverse=True)
+    b = np.bincount(inverse.reshape(-1), weights=c, minlength=len(keys))
+    return (keys // (n*n), (keys // n) % n, keys % n, b)
+
+
+def BWPrefEntropies(v, s, d, b, n, normalized=False, method='MLE'):
+    """Computes betweenness preferences based on the non-zero entries b = B_v[s,d] of the 
+    betweenness preference matrices B_v of nodes v (see BWPrefMatrices). Marginal and conditional 
+    entropies are computed directly from the non-zero entries, using vectorized reductions. 
+    Returns a numpy array with the betweenness preferences of nodes 0, ..., n-1.
+    
+    @param v: numpy array of node indices (in 0, ..., n-1)
+    @param s: numpy array of row (i.e. predecessor) indices
+    @param d: numpy array of column (i.e. successor) indices
+    @param b: numpy array of non-zero entries of the betweenness preference matrices
+    @param n: the number of nodes
+    @param normalized: whether or not (default) to normalize
+    @param method: which entropy estimation method to use. The method supports 
+        'Miller' for Miller-corrected MLE or 'MLE' for a naive MLE estimation. 
+    """
+    assert method == 'MLE' or method =='Miller'
+
+    v = np.asarray(v, dtype=np.int64)
+    m = max(np.max(s)+1, np.max(d)+1) if len(b) > 0 else 1
+
+    # Total number of (weighted) two-paths through each node v
+    N = np.bincount(v, weights=b, minlength=n)
+
+    # Row sums N_s = \sum_d B_v[s,d] and column sums \sum_s B_v[s,d]
+    rows, row_index = np.unique(v * m + s, return_inverse=True)
+    cols, col_index = np.unique(v * m + d, return_inverse=True)
+    row_index = row_index.reshape(-1)
+    col_index = col_index.reshape(-1)
+    N_s = np.bincount(row_index, weights=b)
+    N_d = np.bincount(col_index, weights=b)
+    row_v = rows // m
+    col_v = cols // m
+
+    ## Marginal probabilities P^v_s = \sum_d'{P_{sd'}} and P^v_d = \sum_s'{P_{s'd}}
+    marginal_s = N_s / N[row_v]
+    marginal_d = N_d / N[col_v]
+
+    # Marginal entropies H(S) and H(D)
+    H_s = -np.bincount(row_v, weights=marginal_s * np.log2(marginal_s), minlength=n)
+    H_d = -np.bincount(col_v, weights=marginal_d * np.log2(marginal_d), minlength=n)
+
+    # Entropies of destinations, given a particular source s
+    p_ds = b / N_s[row_index]
+    H_s_rows = -np.bincount(row_index, weights=p_ds * np.log2(p_ds), minlength=len(rows))
+
+    if method == 'Miller':
+        # Miller correction based on the number of possible sources (destinations) K of each 
+        # node, and the number of possible destinations K_s for each source s
+        K_s = np.bincount(row_v, minlength=n)
+        K_d = np.bincount(col_v, minlength=n)
+        observed = N > 0
+        H_s[observed] += (K_s[observed] - 1) / (2 * N[observed])
+        H_d[observed] += (K_d[observed] - 1) / (2 * N[observed])
+        H_s_rows += (K_d[row_v] - 1) / (2 * N_s)
+
+    # Conditional entropy H(D|S)
+    H_ds = np.bincount(row_v, weights=marginal_s * H_s_rows, minlength=n)
+
+    I = H_d - H_ds
     
-    return B_v
+    if normalized:
+        I = I / np.minimum(H_s, H_d)
+
+    return I
 
 
 def BetweennessPreferences(t, normalized=False, method = 'MLE'):
-    bwp = []
-    for v in t.igraphFirstOrder().vs()["name"]:
-        bwp.append(BetweennessPreference(t, v, normalized, method))
-    return np.array(bwp)
+    """Computes the betweenness preferences of all nodes in a temporal network t. Rather than 
+    computing betweenness preferences node by node, all betweenness preference matrices are 
+    computed in a single pass over the two-paths (see BWPrefMatrices), and entropies are 
+    computed with vectorized reductions. Returns a numpy array of betweenness preferences, 
+    ordered in the same way as the vertex sequence of the first-order aggregate network (see 
+    Utilities.firstOrderNameMap). Results are identical to those of BetweennessPreference.
+    
+    @param t: The temporalnetwork instance to work on
+    @param normalized: whether or not (default) to normalize
+    @param method: which entropy estimation method to use. The method supports 
+        'Miller' for Miller-corrected MLE or 'MLE' for a naive MLE estimation. 
+    """
+    assert method == 'MLE' or method =='Miller'
+
+    n = len(Utilities.firstOrderNameMap(t))
+    v, s, d, b = BWPrefMatrices(t)
+
+    return BWPrefEntropies(v, s, d, b, n, normalized, method)
 
 
 def BetweennessPreference(t, v, normalized = False, method = 'MLE'):
-    """Computes the betweenness preference of a node v in a temporal network t
+    """Computes the betweenness preference of a node v in a temporal network t. 
+    The betweenness preference matrix of v is generated as a sparse matrix, and 
+    entropies are computed based on its non-zero entries (see BWPrefEntropies).
     
     @param t: The temporalnetwork instance to work on
     @param v: Name of the node to compute its BetweennessPreference
@@ -282,90 +394,13 @@ def BetweennessPreference(t, v, normalized = False, method = 'MLE'):
         return 0.0
 
     # First create the betweenness preference matrix (equation (2) of the paper)
-    B_v = BWPrefMatrix(t, v)
-    
-    # Normalize matrix (equation (3) of the paper)
-    # NOTE: P_v has the same shape as B_v
-    P_v = np.zeros(shape=B_v.shape)
-    S = np.sum(B_v)
-    
-    if S>0:
-        P_v = B_v / S
-
-    ## Compute marginal probabilities
-    ## Marginal probabilities P^v_d = \sum_s'{P_{s'd}}
-    marginal_d = np.sum(P_v, axis=0)
-
-    ## Marginal probabilities P^v_s = \sum_d'{P_{sd'}}
-    marginal_s = np.sum(P_v, axis=1)        
-
-    if method=='Miller':
-        # print('v = ', v)
-        v_vertex = g.vs.find(name=v)
-           
-        # total number of samples, i.e. observed two-paths
-        N = np.sum(B_v)
-
-        #print('N = ', N)        
-        #print('B = ', B_v)
-        #print('marginal_s = ', marginal_s)
-        #print('marginal_d = ', marginal_d)
-
-        # marginal entropy H(S)
-        H_s = Utilities.Entropy_Miller(marginal_s, len(marginal_s), N)
-        # print('H(S) = ', H_s)
-
-        # marginal entropy H(D)
-        H_d = Utilities.Entropy_Miller(marginal_d, len(marginal_d), N)
-        #print('H(D) = ', H_d)
-
-        # we need the conditional entropy H(D|S)
-        H_ds = 0
-
-        for s in range(len(marginal_s)):
-            # number of two paths s -> v -> * observed in the data
-            N_s = np.sum(B_v[s,:])
-            #print('N(s=' + str(s) + ') = ' +  str(N_s))
-
-            # probabilities of all destinations, given the particular source s
-            p_ds = B_v[s,:]/np.sum(B_v[s,:])
-            #print('P(D|S=' + str(s) + ') = '+ str(p_ds))
-
-            # number of possible destinations d
-            K_s = len(p_ds)
-            #print('K(s=' + str(s) + ') = ' +  str(K_s))
-
-            # marginal_s[s] is the overall probability of source s
-            p_s = marginal_s[s]
-
-            # add to conditional entropy
-            H_ds += p_s * Utilities.Entropy_Miller(p_ds, K_s, N_s)
-
-        #print('H(D|S) = ', H_ds)
-
-    else: 
-        # apply 'naive' MLE estimation, identical to above
-        H_s = Utilities.Entropy(marginal_s)
-        H_d = Utilities.Entropy(marginal_d)
-        H_ds = 0
-        for s in range(len(marginal_s)):
-            p_ds = P_v[s,:]/np.sum(P_v[s,:])
-            H_ds += marginal_s[s] * Utilities.Entropy(p_ds)
-        
-        # Alternative calculation (without explicit entropies)
-        # build mask for non-zero elements
-        # row, col = np.nonzero(P_v)
-        # pv = P_v[(row,col)]
-        # marginal = np.outer(marginal_s, marginal_d)
-        # log_argument = np.divide( pv, marginal[(row,col)] )    
-        # I = np.dot( pv, np.log2(log_argument) )
-    
-    I = H_d - H_ds
-    
-    if normalized:
-        I =  I/np.min([H_s, H_d])
+    B_v = BWPrefMatrix(t, v, sparse_matrix=True).tocoo()
 
-    return I
+    # Compute mutual information based on non-zero entries, where P_v = B_v / sum(B_v) 
+    # (equation (3) of the paper)
+    I = BWPrefEntropies(np.zeros(B_v.nnz, dtype=int), B_v.row, B_v.col, B_v.data, 1, normalized, method)
+
+    return I[0]
 
 
 def SlowDownFactor(t):    
@@ -380,24 +415,14 @@ def SlowDownFactor(t):
     #NOTE to myself: most of the time goes for construction of the 2nd order
     #NOTE            null graph, then for the 2nd order null transition matrix
     
-    g2 = t.igraphSecondOrder().components(mode="STRONG").giant()
-    g2n = t.igraphSecondOrderNull().components(mode="STRONG").giant()
-    
     Log.add('Calculating slow down factor ... ', Severity.INFO)
 
-    # Build transition matrices
-    T2 = Utilities.RWTransitionMatrix(g2)
-    T2n = Utilities.RWTransitionMatrix(g2n)
-    
-    # Compute eigenvector sequences
-    # NOTE: ncv=13 sets additional auxiliary eigenvectors that are computed
-    # NOTE: in order to be more confident to find the one with the largest
-    # NOTE: magnitude, see
-    # NOTE: https://github.com/scipy/scipy/issues/4987
-    w2 = sla.eigs(T2, which="LM", k=2, ncv=13, return_eigenvectors=False)
+    # Compute (cached) eigenvalues of transition matrices of the 
+    # second-order network and the second-order null model
+    w2 = t.getLeadingEigenvalues('SECOND')
     evals2_sorted = np.sort(-np.absolute(w2))
 
-    w2n = sla.eigs(T2n, which="LM", k=2, ncv=13, return_eigenvectors=False)
+    w2n = t.getLeadingEigenvalues('NULL')
     evals2n_sorted = np.sort(-np.absolute(w2n))
 
     Log.add('finished.', Severity.INFO)
@@ -416,24 +441,14 @@ def EigenValueGap(t):
     #NOTE to myself: most of the time goes for construction of the 2nd order
     #NOTE            null graph, then for the 2nd order null transition matrix
     
-    g2 = t.igraphSecondOrder().components(mode="STRONG").giant()
-    g2n = t.igraphSecondOrderNull().components(mode="STRONG").giant()
-    
     Log.add('Calculating eigenvalue gap ... ', Severity.INFO)
 
-    # Build transition matrices
-    T2 = Utilities.RWTransitionMatrix(g2)
-    T2n = Utilities.RWTransitionMatrix(g2n)
-    
-    # Compute eigenvector sequences
-    # NOTE: ncv=13 sets additional auxiliary eigenvectors that are computed
-    # NOTE: in order to be more confident to find the one with the largest
-    # NOTE: magnitude, see
-    # NOTE: https://github.com/scipy/scipy/issues/4987
-    w2 = sla.eigs(T2, which="LM", k=2, ncv=13, return_eigenvectors=False)
+    # Compute (cached) eigenvalues of transition matrices of the 
+    # second-order network and the second-order null model
+    w2 = t.getLeadingEigenvalues('SECOND')
     evals2_sorted = np.sort(-np.absolute(w2))
 
-    w2n = sla.eigs(T2n, which="LM", k=2, ncv=13, return_eigenvectors=False)
+    w2n = t.getLeadingEigenvalues('NULL')
     evals2n_sorted = np.sort(-np.absolute(w2n))
 
     Log.add('finished.', Severity.INFO)
@@ -455,9 +470,9 @@ def GetStaticEigenvectorCentrality(t, model='SECOND'):
     name_map = Utilities.firstOrderNameMap(t)
     
     if model == 'SECOND':
-        g2 = t.igraphSecondOrder()
+        g2 = t.igraphSecondOrder(names=False)
     else:
-        g2 = t.igraphSecondOrderNull()
+        g2 = t.igraphSecondOrderNull(names=False)
     
     # Compute eigenvector centrality in second-order network
     A = Utilities.getSparseAdjacencyMatrix( g2, attribute="weight", transposed=True )
@@ -465,11 +480,9 @@ def GetStaticEigenvectorCentrality(t, model='SECOND'):
     
     # Aggregate to obtain first-order eigenvector centrality
     evcent_1 = np.zeros(len(name_map))
-    sep = t.separator
-    for i in range(len(evcent_2)):
-        # Get name of target node
-        target = g2.vs()[i]["name"].split(sep)[1]
-        evcent_1[name_map[target]] += np.real(evcent_2[i])
+    # Index of target node of each second-order node
+    targets = np.array(g2.vs["target"], dtype=int)
+    np.add.at(evcent_1, targets, np.real(evcent_2))
     
     return np.real(evcent_1/sum(evcent_1))
 
@@ -490,9 +503,9 @@ def GetStaticPageRank(t, model='SECOND', projection='TARGET', normalization=Fals
     name_map = Utilities.firstOrderNameMap( t )
 
     if model == 'SECOND':
-        g2 = t.igraphSecondOrder()
+        g2 = t.igraphSecondOrder(names=False)
     else:
-        g2 = t.igraphSecondOrderNull()    
+        g2 = t.igraphSecondOrderNull(names=False)    
 
     # Compute pagerank centrality in second-order network
     pagerank_2 = np.array(g2.pagerank(weights=g2.es()['weight'], directed=True))
@@ -500,17 +513,13 @@ def GetStaticPageRank(t, model='SECOND', projection='TARGET', normalization=Fals
     # Aggregate to obtain first-order pagerank centrality
     pagerank_1 = np.zeros(len(name_map))
     counts = np.array([1]*len(name_map))
-    sep = t.separator
-    for i in range(len(pagerank_2)):
-        # Get name of target node        
-        if projection == 'TARGET':
-            target = g2.vs()[i]["name"].split(sep)[1]
-            pagerank_1[name_map[target]] += pagerank_2[i]
-            counts[name_map[target]] +=1 
-        else:
-            source = g2.vs()[i]["name"].split(sep)[0]
-            pagerank_1[name_map[source]] += pagerank_2[i]
-            counts[name_map[source]] +=1 
+    # Index of target (or source) node of each second-order node
+    if projection == 'TARGET':
+        nodes = np.array(g2.vs["target"], dtype=int)
+    else:
+        nodes = np.array(g2.vs["source"], dtype=int)
+    np.add.at(pagerank_1, nodes, pagerank_2)
+    np.add.at(counts, nodes, 1)
     
     if normalization == True:
         pagerank_1 = pagerank_1 / counts
@@ -523,6 +532,15 @@ def GetStaticBetweenness(t, model='SECOND'):
     """Computes betweenness centralities of nodes based on the second-order aggregate network, 
     and aggregates betweenness centralities to obtain the betweenness centrality of nodes in the 
     first-order network.
+
+    For each pair of second-order nodes v=(s,*) and w=(*,d), whose shortest path length 
+    corresponds to the shortest path length between s and d in the second-order network, 
+    each shortest path p from v to w contributes one to the betweenness of all intermediate 
+    first-order nodes along p. Rather than enumerating all shortest paths, the number of 
+    shortest paths passing through each node is computed by a dependency accumulation 
+    (in the style of Brandes' algorithm) on the breadth-first search DAG of each second-order 
+    node. Each breadth-first search only visits the links leaving its frontier, such that the 
+    computation requires time O(V*(V+E)) for V nodes and E links in the second-order network.
     
     @param t: The temporalnetwork instance to work on
     @param model: either C{"SECOND"} or C{"NULL"}, where C{"SECOND"} is the 
@@ -532,33 +550,73 @@ def GetStaticBetweenness(t, model='SECOND'):
     if (model is "SECOND" or "NULL") == False:
         raise ValueError("model must be one of \"SECOND\" or \"NULL\"")
 
-    D = Paths.GetSecondOrderDistanceMatrix(t)
+    D = Paths.GetSecondOrderDistanceMatrix(t, model)
     name_map = Utilities.firstOrderNameMap( t )
 
     if model == 'SECOND':
-        g2 = t.igraphSecondOrder()
+        g2 = t.igraphSecondOrder(names=False)
     else:
-        g2 = t.igraphSecondOrderNull()
+        g2 = t.igraphSecondOrderNull(names=False)
 
     # Compute betweenness centrality based on second-order network
     bwcent_1 = np.zeros(len(name_map))
-    sep = t.separator
-
-    for v in g2.vs()["name"]:
-        for w in g2.vs()["name"]:
-            s = v.split(sep)[0]
-            t = w.split(sep)[1]
-            X = g2.get_all_shortest_paths(v,w)
-            for p in X:
-                if D[name_map[s], name_map[t]] == len(p) and len(p) > 1:
-                    for i in range(len(p)):
-                        source = g2.vs()["name"][p[i]].split(sep)[0]
-                        if i>0:
-                            bwcent_1[name_map[source]] += 1 
+    sources = np.array(g2.vs["source"], dtype=int)
+    targets = np.array(g2.vs["target"], dtype=int)
+    n = g2.vcount()
+
+    A = Utilities.getSparseAdjacencyMatrix(g2)
+    indptr, indices = A.indptr, A.indices
+    pos = np.zeros(n, dtype=int)
+
+    for v in range(n):
+        # Breadth-first search from v, counting the number of shortest paths 
+        # sigma[w] from v to all nodes w, level by level. Only the out-links of 
+        # the frontier are expanded, and the links of the shortest path DAG 
+        # between subsequent levels are kept for the accumulation
+        dist = np.full(n, -1)
+        sigma = np.zeros(n)
+        dist[v] = 0
+        sigma[v] = 1.
+        dag = []
+        frontier = np.array([v])
+        while True:
+            starts = indptr[frontier]
+            degrees = indptr[frontier+1] - starts
+            offsets = np.cumsum(degrees) - degrees
+            parents = np.repeat(np.arange(len(frontier)), degrees)
+            children = indices[np.arange(degrees.sum()) - np.repeat(offsets - starts, degrees)]
+            keep = dist[children] < 0
+            parents, children = parents[keep], children[keep]
+            if len(children) == 0:
+                break
+
+            # Number the distinct children, such that paths can be summed with bincount
+            k = np.arange(len(children))
+            pos[children] = k
+            new = children[pos[children] == k]
+            pos[new] = np.arange(len(new))
+            sigma[new] = np.bincount(pos[children], weights=sigma[frontier][parents], minlength=len(new))
+            dist[new] = len(dag) + 1
+            dag.append((frontier, parents, children))
+            frontier = new
+
+        # Shortest paths from v to w are counted if their length corresponds to the 
+        # shortest path length between the first-order nodes s and d
+        counted = (dist > 0) & (dist + 1 == D[sources[v], targets])
+
+        # Accumulate the number of counted shortest paths starting in each node, 
+        # in reverse order of breadth-first search levels
+        c = counted.astype(float)
+        for frontier, parents, children in reversed(dag[1:]):
+            c[frontier] += np.bincount(parents, weights=c[children], minlength=len(frontier))
+
+        # Each counted shortest path through w contributes to the source node of w
+        c[v] = 0
+        bwcent_1 += np.bincount(sources, weights=sigma * c, minlength=len(bwcent_1))
     return bwcent_1
 
 
-def GetTemporalBetweenness(t, delta=1, normalized=False):
+def GetTemporalBetweenness(t, delta=1, normalized=False, workers=1):
     """Calculates the temporal betweenness centralities of all nodes 
     in a temporal network t based on the shortest time-respecting paths with a 
     maximum waiting time of delta. This function returns a numpy array of temporal betweenness centrality values of 
@@ -572,25 +630,31 @@ def GetTemporalBetweenness(t, delta=1, normalized=False):
         by the class TemporalNetwork
     @param normalized: whether or not to normalize centralities by dividing each value byt the total number 
         of shortest time-respecting paths.
+    @param workers: the number of processes to use. For workers > 1, paths from blocks of source nodes 
+        are counted in a pool of processes.
     """
 
-    bw = np.array([0]*len(t.nodes))
-    S = 0
-
     name_map = Utilities.firstOrderNameMap(t)
 
-    minD, minPaths = Paths.GetMinTemporalDistance(t, delta=1, collect_paths=True)
+    index = Paths.TemporalPathIndex(t, delta)
+    D = Paths.sweepMinTemporalDistances(t.getEdgeStore(), delta, workers=workers)
 
-    for v in t.nodes:
-        for w in t.nodes:
-            for p in minPaths[v][w]:
-                for i in range(1,len(p)-1):
-                    bw[name_map[p[i][0]]] += 1
-                    S+=1
+    # Count shortest time-respecting paths through each node by accumulating 
+    # dependencies from all nodes and start times, without enumerating paths
+    counts = np.zeros(index.n)
+    chunks = [ (v_from, v_to, None) for v_from, v_to in Paths.getSourceChunks(index.n, workers) ]
+    for c in Paths.mapTemporalPathSearch(Paths.accumulateTemporalBetweenness, chunks, workers, index=index, D=D):
+        counts += c
+
+    bw = np.zeros(len(t.nodes))
+    bw[[ name_map[v] for v in index.names ]] = counts
+
+    if normalized and bw.sum() > 0:
+        bw = bw/bw.sum()
     return bw
 
 
-def GetTemporalBetweennessInstantaneous(t, start_t=0, delta=1, normalized=False):
+def GetTemporalBetweennessInstantaneous(t, start_t=0, delta=1, normalized=False, workers=1):
     """Calculates the temporal betweennness values of 
     all nodes fir a given start time start_t in an empirical temporal network t.
     This function returns a numpy array of (temporal) betweenness centrality values. 
@@ -607,29 +671,28 @@ def GetTemporalBetweennessInstantaneous(t, start_t=0, delta=1, normalized=False)
         by the class TemporalNetwork
     @param normalized: whether or not to normalize the temporal betweenness centrality values by
     dividing by the number of all shortest time-respecting paths in the temporal network.
+    @param workers: the number of processes to use. For workers > 1, paths from blocks of source nodes 
+        are counted in a pool of processes.
     """
 
-    bw = np.array([0]*len(t.nodes))
-
-    # First calculate all shortest time-respecting paths starting at time start_t
-    D, paths = Paths.GetTemporalDistanceMatrix(t, start_t, delta, collect_paths=True)
-
     # Get a mapping between node names and matrix indices
     name_map = Utilities.firstOrderNameMap( t )
 
-    # Compute betweenness scores of all nodes based on shortest time-respecting paths
-    k=0
-    for u in t.nodes:
-        for v in t.nodes:
-            if u != v:
-                for p in paths[u][v]:
-                    for i in range(1, len(p)-1):
-                        bw[name_map[p[i][0]]] += 1
-                        k+=1
+    index = Paths.TemporalPathIndex(t, delta)
+
+    # Compute betweenness scores of all nodes by counting shortest time-respecting paths 
+    # starting at time start_t, and accumulating the dependencies of nodes
+    counts = np.zeros(index.n)
+    chunks = [ (v_from, v_to, start_t) for v_from, v_to in Paths.getSourceChunks(index.n, workers) ]
+    for c in Paths.mapTemporalPathSearch(Paths.accumulateTemporalBetweenness, chunks, workers, index=index):
+        counts += c
+
+    bw = np.zeros(len(t.nodes))
+    bw[[ name_map[v] for v in index.names ]] = counts
 
     # Normalize by dividing by the total number of shortest time-respecting paths
-    if normalized:
-        bw = bw/k
+    if normalized and bw.sum() > 0:
+        bw = bw/bw.sum()
     return bw
 
 
@@ -646,55 +709,46 @@ def GetStaticCloseness(t, model='SECOND'):
     else:
         D = Paths.GetSecondOrderDistanceMatrix(t, model)
 
-    name_map = Utilities.firstOrderNameMap( t )
-
-    closeness = np.zeros(len(name_map))
-
     # Calculate closeness for each node u, by summing the reciprocal of its 
     # distances to all other nodes. Note that this definition of closeness centrality 
     # is required for directed networks that are not strongly connected. 
-    for u in t.nodes:
-        for v in t.nodes:
-            if u!=v:
-                closeness[name_map[u]] += 1./D[name_map[v], name_map[u]] 
-    return closeness
+    with np.errstate(divide='ignore'):
+        R = 1./D
+    np.fill_diagonal(R, 0)
+    return np.sum(R, axis=0)
 
 
-def GetTemporalCloseness(t, delta=1):
+def GetTemporalCloseness(t, delta=1, workers=1, batch_size=1000):
     """Calculates the temporal closeness centralities of all nodes 
     in a temporal network t, based on the minimal shortest time-respecting paths with a 
     maximum time difference of delta. This function then returns a numpy 
     array of average (temporal) closeness centrality values of nodes. The ordering of these 
     values corresponds to the ordering of nodes in the vertex sequence of the igraph first order 
     time-aggregated network. A mapping between node names and array indices can be found in 
-    Utilities.firstOrderNameMap().
+    Utilities.firstOrderNameMap(). Shortest path lengths are computed for batches of source 
+    nodes in forward sweeps over the time-stamped edges, without keeping an N x N matrix.
     
     @param t: the temporal network for which temporal closeness centralities will be computed    
     @param delta: the maximum waiting time used in the time-respecting path definition (default 1)      
         Note that this parameter is independent from the delta used internally for the extraction of two-paths
         by the class TemporalNetwork     
+    @param workers: the number of processes to use. For workers > 1, batches of source nodes are 
+        processed by a pool of processes.
+    @param batch_size: the number of source nodes processed in one sweep (default 1000)
     """
 
-    cl = np.array([0.]*len(t.nodes))
-
-    name_map = Utilities.firstOrderNameMap( t )
+    return temporalCloseness(t, None, delta, workers, batch_size)
 
-    minD, minPaths = Paths.GetMinTemporalDistance(t, delta, collect_paths=False)
 
-    for u in t.nodes:
-        for v in t.nodes:
-            if u!= v:
-                cl[name_map[v]] += 1./minD[name_map[u], name_map[v]]
-    return cl
-
-
-def GetTemporalClosenessInstantaneous(t, start_t=0, delta=1):
+def GetTemporalClosenessInstantaneous(t, start_t=0, delta=1, workers=1, batch_size=1000):
     """Calculates the temporal closeness values of 
     all nodes for a given start time start_t in a temporal network t.
     This function returns a numpy array of (temporal) closeness centrality values. 
     The ordering of these values corresponds to the ordering of nodes in the vertex 
     sequence of the igraph first order time-aggregated network. A mapping between node names
-    and array indices can be found in Utilities.firstOrderNameMap().
+    and array indices can be found in Utilities.firstOrderNameMap(). Shortest path lengths are 
+    computed for batches of source nodes in forward sweeps over the time-stamped edges, without 
+    keeping an N x N matrix.
     
     @param t: the temporal network for which temporal closeness centralities will be computed
     @param start_t: the start time for which to consider time-respecting paths (default 0). This is 
@@ -703,25 +757,197 @@ def GetTemporalClosenessInstantaneous(t, start_t=0, delta=1):
     @param delta: the maximum time difference time used in the time-respecting path definition (default 1)
         Note that this parameter is independent from the delta used internally for the extraction of two-paths
         by the class TemporalNetwork.
+    @param workers: the number of processes to use. For workers > 1, batches of source nodes are 
+        processed by a pool of processes.
+    @param batch_size: the number of source nodes processed in one sweep (default 1000)
     """
-    
-    closeness = np.array([0.]*len(t.nodes))
 
-    # Calculate all shortest time-respecting paths
-    D, paths = Paths.GetTemporalDistanceMatrix(t, start_t, delta, collect_paths=False)
+    return temporalCloseness(t, start_t, delta, workers, batch_size)
+
+
+def temporalCloseness(t, start_t, delta, workers, batch_size):
+    """Calculates temporal closeness centralities for paths starting at time start_t, or at any 
+    time if start_t is None (see GetTemporalCloseness and GetTemporalClosenessInstantaneous).
+    Note that this definition of closeness centrality, which sums the reciprocal distances from 
+    all other nodes, is required for directed networks that are not strongly connected."""
+
+    store = t.getEdgeStore()
+    n = store.vcount()
+
+    # Batches are independent of the number of workers, such that results do not depend on it
+    chunks = [ (i, min(i+batch_size, n), start_t) for i in range(0, n, batch_size) ]
+    closeness = np.zeros(n)
+    for c in Paths.mapTemporalPathSearch(Paths.accumulateTemporalCloseness, chunks, workers, store=store, delta=delta):
+        closeness += c
 
     # Get a mapping between node names and matrix indices
     name_map = Utilities.firstOrderNameMap( t )
 
-    # Calculate closeness for each node u, by summing the reciprocal of its 
-    # distances to all other nodes. Note that this definition of closeness centrality 
-    # is required for directed networks that are not strongly connected. 
-    for u in t.nodes:
-        for v in t.nodes:
-            if u!=v:
-                closeness[name_map[u]] += 1./D[name_map[v], name_map[u]]
+    cl = np.zeros(len(t.nodes))
+    cl[[ name_map[v] for v in store.names ]] = closeness
+    return cl
 
-    return closeness
+
+def GetTemporalBetweennessApprox(t, delta=1, epsilon=0.05, confidence=0.95, batch_size=100, max_samples=None, min_nonzero=30, workers=1):
+    """Estimates the temporal betweenness centralities of all nodes (see GetTemporalBetweenness) 
+    by sampling pairs of source nodes and start times uniformly at random from t.nodes and 
+    t.ordered_times. Samples are drawn in batches until at least min_nonzero samples with non-zero 
+    counts have been seen and the confidence intervals of all nodes are narrower than epsilon times 
+    the largest estimated value, or until max_samples (or nodes times start times) samples have been 
+    drawn. This function returns a tuple (bw, err) of numpy arrays, where bw contains the estimated 
+    betweenness values and [bw-err, bw+err] are their (normal approximation) confidence intervals. 
+    For nodes without any non-zero sample, err is a rule-of-three upper bound (see estimateTotals). 
+    The ordering of these values corresponds to the ordering of nodes in 
+    the vertex sequence of the igraph first order time-aggregated network. A mapping between 
+    node names and array indices can be found in Utilities.firstOrderNameMap().
+
+    @param t: the temporal network for which temporal betweenness centralities will be estimated
+    @param delta: the maximum time difference used in the time-respecting path definition (default 1)
+    @param epsilon: the target half-width of confidence intervals, relative to the largest 
+        estimated betweenness value (default 0.05)
+    @param confidence: the confidence level of the intervals (default 0.95)
+    @param batch_size: the number of samples drawn before checking the stopping criterion (default 100)
+    @param max_samples: the maximum number of samples. If None, sampling continues until the 
+        target error is reached, or the number of samples equals the number of pairs of nodes 
+        and start times.
+    @param min_nonzero: the minimum number of samples with non-zero counts before sampling 
+        can stop (default 30)
+    @param workers: the number of processes to use. For workers > 1, the samples of each batch
+        are processed by a pool of processes.
+    """
+
+    index = Paths.TemporalPathIndex(t, delta)
+    store = t.getEdgeStore()
+    population = index.n * len(index.times)
+    z = stats.norm.ppf(0.5 + confidence/2.)
+
+    limit = population if max_samples is None else min(max_samples, population)
+
+    s = np.zeros(index.n)
+    q = np.zeros(index.n)
+    k = 0
+    nonzero = 0
+    peak = 0.
+    bw, err = estimateTotals(s, q, k, population, z, confidence=confidence)
+    while k < limit:
+        m = min(batch_size, limit-k)
+        sources = np.random.randint(index.n, size=m)
+        times = index.times[np.random.randint(len(index.times), size=m)]
+        samples = list(zip(sources.tolist(), times.tolist()))
+        chunks = [ samples[i:i+max(1, -(-m // workers))] for i in range(0, m, max(1, -(-m // workers))) ]
+        for s_c, q_c, nonzero_c, peak_c in Paths.mapTemporalPathSearch(Paths.sampleTemporalBetweenness, chunks, workers, index=index, store=store, delta=delta):
+            s += s_c
+            q += q_c
+            nonzero += nonzero_c
+            peak = max(peak, peak_c)
+        k += m
+        # Counts of shortest paths through a node are at least one if they are non-zero
+        bw, err = estimateTotals(s, q, k, population, z, confidence=confidence, scale=max(peak, 1.))
+        if nonzero >= min_nonzero and bw.max() > 0 and err.max() <= epsilon * bw.max():
+            break
+
+    Log.add('Estimated temporal betweenness from ' + str(k) + ' samples')
+
+    name_map = Utilities.firstOrderNameMap( t )
+    ix = [ name_map[v] for v in index.names ]
+    result = np.zeros((2, len(t.nodes)))
+    result[0, ix] = bw
+    result[1, ix] = err
+    return result[0], result[1]
+
+
+def GetTemporalClosenessApprox(t, delta=1, epsilon=0.05, confidence=0.95, batch_size=100, min_nonzero=30, workers=1):
+    """Estimates the temporal closeness centralities of all nodes (see GetTemporalCloseness) 
+    by sampling source nodes from t.nodes without replacement. Since the minimum temporal distances 
+    from a source node across all start times are computed in a single sweep over the time-stamped 
+    edges, start times do not need to be sampled. Source nodes are drawn in batches until at least 
+    min_nonzero sources reaching some node have been seen and the confidence intervals of all nodes 
+    are narrower than epsilon times the largest estimated value, or until all nodes have been drawn. 
+    This function returns a tuple (cl, err) of numpy arrays, where cl contains the estimated closeness 
+    values and [cl-err, cl+err] are their (normal approximation) confidence intervals. For nodes which 
+    have not been reached from any sampled source, err is a rule-of-three upper bound. The ordering of these values corresponds to the ordering 
+    of nodes in the vertex sequence of the igraph first order time-aggregated network. A mapping 
+    between node names and array indices can be found in Utilities.firstOrderNameMap().
+
+    @param t: the temporal network for which temporal closeness centralities will be estimated
+    @param delta: the maximum waiting time used in the time-respecting path definition (default 1)
+    @param epsilon: the target half-width of confidence intervals, relative to the largest 
+        estimated closeness value (default 0.05)
+    @param confidence: the confidence level of the intervals (default 0.95)
+    @param batch_size: the number of source nodes drawn before checking the stopping criterion (default 100)
+    @param min_nonzero: the minimum number of sampled sources reaching any node before sampling 
+        can stop (default 30)
+    @param workers: the number of processes to use. For workers > 1, the source nodes of each batch
+        are processed by a pool of processes.
+    """
+
+    store = t.getEdgeStore()
+    n = store.vcount()
+    z = stats.norm.ppf(0.5 + confidence/2.)
+
+    order = np.random.permutation(n)
+    s = np.zeros(n)
+    q = np.zeros(n)
+    k = 0
+    nonzero = 0
+    cl, err = estimateTotals(s, q, k, n, z, replacement=False, confidence=confidence)
+    while k < n:
+        m = min(batch_size, n-k)
+        sources = order[k:k+m]
+        chunks = np.array_split(sources, min(workers, m))
+        for s_c, q_c, nonzero_c, peak_c in Paths.mapTemporalPathSearch(Paths.sampleTemporalCloseness, chunks, workers, store=store, delta=delta):
+            s += s_c
+            q += q_c
+            nonzero += nonzero_c
+        k += m
+        # Reciprocal distances are at most one
+        cl, err = estimateTotals(s, q, k, n, z, replacement=False, confidence=confidence)
+        if nonzero >= min_nonzero and cl.max() > 0 and err.max() <= epsilon * cl.max():
+            break
+
+    Log.add('Estimated temporal closeness from ' + str(k) + ' samples')
+
+    name_map = Utilities.firstOrderNameMap( t )
+    ix = [ name_map[v] for v in store.names ]
+    result = np.zeros((2, len(t.nodes)))
+    result[0, ix] = cl
+    result[1, ix] = err
+    return result[0], result[1]
+
+
+def estimateTotals(s, q, k, population, z, replacement=True, confidence=0.95, scale=1.):
+    """Estimates the totals of values over a population from the sums s and sums of squares q 
+    of k samples drawn uniformly at random. This returns a tuple of arrays (estimate, error), 
+    where error is the half-width of the confidence intervals for the normal quantile z. For 
+    values which are zero in all samples, the normal approximation gives no information. Their 
+    error is instead the rule-of-three upper bound population * scale * -ln(1-confidence) / k, 
+    i.e. the total if a fraction -ln(1-confidence)/k of the population had the value scale.
+
+    @param s: array of sums of the sampled values
+    @param q: array of sums of squares of the sampled values
+    @param k: the number of samples
+    @param population: the size of the population
+    @param z: the quantile of the standard normal distribution for the desired confidence level
+    @param replacement: whether samples were drawn with replacement. If False, the finite 
+        population correction is applied.
+    @param confidence: the confidence level of the upper bound for values without non-zero samples
+    @param scale: the assumed magnitude of a non-zero sampled value
+    """
+    if k == 0:
+        err = np.zeros(len(s))
+        err.fill(population * scale)
+        return np.zeros(len(s)), err
+    mean = s / k
+    var = np.zeros(len(s))
+    if k > 1:
+        var = np.maximum(q - k * mean * mean, 0) / (k - 1)
+    err = z * population * np.sqrt(var / k)
+    unseen = min(population * scale * -np.log(1. - confidence) / k, population * scale)
+    if not replacement:
+        err *= np.sqrt(max(population - k, 0) / max(population - 1., 1.))
+        unseen *= max(population - k, 0) / float(population)
+    err[s == 0] = unseen
+    return population * mean, err
 
 
 def WeightedKCore( t, alpha, beta ):
@@ -815,7 +1041,7 @@ def DetectTemporalCommunities( t, projection="TARGET", method="INFOMAP"):
 
     # Calculate first- and second-order aggregate networks
     first = t.igraphFirstOrder()
-    second = t.igraphSecondOrder()
+    second = t.igraphSecondOrder(names=False)
 
     membership_counts = defaultdict(lambda: defaultdict( lambda: 0))
 
@@ -827,10 +1053,11 @@ def DetectTemporalCommunities( t, projection="TARGET", method="INFOMAP"):
     else:
         raise Exception("Unsupported community detection method")
     
+    sources = second.vs["source"]
+    targets = second.vs["target"]
     for i in range(second.vcount()):
-        v_2 = second.vs[i]['name'].split(t.separator)
-        v_1_id = first.vs.find(name=v_2[0]).index
-        w_1_id = first.vs.find(name=v_2[1]).index
+        v_1_id = sources[i]
+        w_1_id = targets[i]
         if projection == "SOURCE":
             membership_counts[v_1_id][clusters.membership[i]] = membership_counts[v_1_id][clusters.membership[i]] + 1
             #membership_1[v_1_id] = clusters.membership[i]
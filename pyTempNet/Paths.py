@@ -7,19 +7,62 @@ Created on Thu Aug 18 17:28:39 2015
 """
 
 import numpy as np
+import multiprocessing
 import scipy.sparse as sparse
 import scipy.sparse.linalg as sla
+import scipy.sparse.csgraph as csgraph
 
 from collections import defaultdict
-
-from bisect import bisect_left
-from bisect import bisect_right
+from collections import deque
 
 from pyTempNet import Utilities
 from pyTempNet.Log import *
 
 
-def GetFirstOrderDistanceMatrix(t):        
+def convertDistances(D, dtype=np.float64):
+    """Converts a matrix of shortest path lengths with entries np.inf for unreachable 
+    pairs of nodes to the given dtype. For integer types, which cannot represent np.inf, 
+    unreachable pairs are indicated by the maximum value of the type (e.g. 65535 for np.uint16).
+
+    @param D: a numpy array of (float) shortest path lengths
+    @param dtype: the dtype of the returned array, e.g. np.float64, np.float32 or np.uint16
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu':
+        D = np.where(np.isinf(D), np.iinfo(dtype).max, D)
+    return D.astype(dtype, copy=False)
+
+
+def GetFirstOrderDistanceRows(t, chunk_size=1000, dtype=np.float64):
+    """Calculates shortest path lengths between all pairs of nodes based on the topology 
+    of the *first-order* aggregate network (see GetFirstOrderDistanceMatrix), and yields 
+    blocks of rows of the distance matrix. This allows to process the distances of large 
+    networks without allocating the full matrix. Each block is returned as a tuple (i, D_i), 
+    where D_i is a numpy array with shape (k, n) containing the shortest path lengths from 
+    the nodes with indices i, ..., i+k-1 to all n nodes.
+
+    @param t: the temporal network to calculate shortest path lengths for based on a first-order
+        aggregate representation    
+    @param chunk_size: the maximum number of rows per block
+    @param dtype: the dtype of the returned rows (see convertDistances)
+    """
+    # Make sure that the first-order network only contains links which contribute to 
+    # time-respecting paths
+    g1 = t.igraphFirstOrder()
+    if g1["all_links"]:
+        g1 = t.igraphFirstOrder(all_links=False, force=True)
+
+    A = Utilities.getSparseAdjacencyMatrix(g1)
+    n = A.shape[0]
+
+    # Compute shortest path lengths for all sources in a block by breadth-first searches
+    for i in range(0, n, chunk_size):
+        sources = np.arange(i, min(i+chunk_size, n))
+        D = csgraph.shortest_path(A, method='D', directed=True, unweighted=True, indices=sources)
+        yield (i, convertDistances(D, dtype))
+
+
+def GetFirstOrderDistanceMatrix(t, dtype=np.float64):        
     """Calculates a matrix D containing the shortest path lengths between all
     pairs of nodes calculated based on the topology of the *first-order* aggregate network. 
     The ordering of rows/columns corresponds to the ordering of nodes in the vertex sequence of 
@@ -28,109 +71,815 @@ def GetFirstOrderDistanceMatrix(t):
     
     @param t: the temporal network to calculate shortest path lengths for based on a first-order
         aggregate representation    
+    @param dtype: the dtype of the returned matrix, e.g. np.float32 or np.uint16 to save memory 
+        (see convertDistances). Use GetFirstOrderDistanceRows to process the matrix in blocks of rows.
     """   
 
-    # This way of generating the first-order time-aggregated network makes sure that 
-    # links are not omitted even if they do not contribute to any time-respecting path
-    g1 = t.igraphFirstOrder(all_links=False, force=True)
+    n = len(t.nodes)
+    D = np.empty(shape=(n, n), dtype=dtype)
+    for i, D_i in GetFirstOrderDistanceRows(t, chunk_size=max(n, 1), dtype=dtype):
+        D[i:i+len(D_i),:] = D_i
+    return D
 
-    name_map = Utilities.firstOrderNameMap( t )
 
-    D = np.zeros(shape=(len(t.nodes),len(t.nodes)))
-    D.fill(np.inf)
-    np.fill_diagonal(D, 0)
+"""Adjacency matrix and projection index arrays shared with the worker processes 
+of GetSecondOrderDistanceMatrix"""
+secondOrderProjection = {}
 
-    for v in g1.vs()["name"]:
-        for w in g1.vs()["name"]:
-            # Compute all shortest paths using igraph
-            X = g1.get_shortest_paths(v,w)
-            for p in X:
-                if len(p)>0:
-                    D[name_map[v], name_map[w]] = len(p)-1
-    return D
 
+def initSecondOrderProjection(A, sources, targets, n):
+    """Initializes the data used by projectSecondOrderDistances in a (worker) process
+
+    @param A: the sparse adjacency matrix of the second-order network
+    @param sources: numpy array of indices of the first-order source nodes of all second-order nodes
+    @param targets: numpy array of indices of the first-order target nodes of all second-order nodes
+    @param n: the number of first-order nodes
+    """
+    # Group second-order nodes (columns) by their first-order target node
+    order = np.argsort(targets, kind='stable')
+    new = np.concatenate(([True], targets[order][1:] != targets[order][:-1]))
+    secondOrderProjection['A'] = A
+    secondOrderProjection['sources'] = sources
+    secondOrderProjection['order'] = order
+    secondOrderProjection['starts'] = np.flatnonzero(new)
+    secondOrderProjection['targets'] = targets[order][new]
+    secondOrderProjection['n'] = n
+
+
+def projectSecondOrderDistances(chunk):
+    """Computes shortest path lengths from a range of second-order nodes (which must be 
+    ordered by their first-order source node) to all second-order nodes by breadth-first 
+    searches, and projects them to first-order nodes. Returns a tuple (s, D_s), where s is 
+    an array of first-order source nodes and D_s contains the minimum path lengths from 
+    each node in s to all first-order nodes.
+
+    @param chunk: a tuple (i, j) of indices of the first and last+1 second-order node
+    """
+    i, j = chunk
+    p = secondOrderProjection
+    D2 = csgraph.shortest_path(p['A'], method='D', directed=True, unweighted=True, indices=np.arange(i, j))
 
-def GetSecondOrderDistanceMatrix(t, model='SECOND'):
+    # A path of k second-order links corresponds to a first-order path of length k+1
+    D2 += 1
+
+    # Minimum over all second-order nodes with the same first-order target (columns) ...
+    D_t = np.full((j-i, p['n']), np.inf)
+    D_t[:, p['targets']] = np.minimum.reduceat(D2[:, p['order']], p['starts'], axis=1)
+
+    # ... and with the same first-order source (rows)
+    sources = p['sources'][i:j]
+    new = np.concatenate(([True], sources[1:] != sources[:-1]))
+    return (sources[new], np.minimum.reduceat(D_t, np.flatnonzero(new), axis=0))
+
+
+def GetSecondOrderDistanceMatrix(t, model='SECOND', workers=1, chunk_size=1000):
     """Calculates a matrix D containing the shortest path lengths between all
     pairs of nodes calculated based on the topology of the *second-order* aggregate network. 
     The ordering of rows/columns corresponds to the ordering of nodes in the vertex sequence of 
     the igraph first order time-aggregated network. A mapping between nodes and indices can be 
     found in Utilities.firstOrderNameMap().    
+
+    The shortest path length between first-order nodes s and d is the minimum length of all 
+    shortest paths between second-order nodes s-* and *-d. It is computed by one breadth-first 
+    search per second-order node, and the results are projected to first-order nodes by 
+    grouping second-order nodes according to their first-order source and target nodes.
     
     @param t: the temporal network to calculate shortest path lengths for based on a second-order
         aggregate representation 
     @param model: either C{"SECOND"} or C{"NULL"}, where C{"SECOND"} is the 
       the default value.   
+    @param workers: the number of processes to use. For workers > 1, breadth-first searches 
+        from blocks of second-order nodes are distributed across a pool of processes.
+    @param chunk_size: the number of second-order nodes for which shortest path lengths are 
+        computed (and held in memory) at once
     """   
 
     if (model is "SECOND" or "NULL") == False:
         raise ValueError("model must be one of \"SECOND\" or \"NULL\"")
 
-    name_map = Utilities.firstOrderNameMap( t )
-
     if model == 'SECOND':
-        g2 = t.igraphSecondOrder()
+        g2 = t.igraphSecondOrder(names=False)
     else:
-        g2 = t.igraphSecondOrderNull()    
+        g2 = t.igraphSecondOrderNull(names=False)    
 
-    D = np.zeros(shape=(len(t.nodes),len(t.nodes)))
+    n = len(t.nodes)
+    D = np.zeros(shape=(n,n))
     D.fill(np.inf)
+
+    if g2.vcount() > 0:
+        # Order second-order nodes by their first-order source node, such that 
+        # each block of rows can be projected by a reduction 
+        sources = np.array(g2.vs["source"], dtype=int)
+        targets = np.array(g2.vs["target"], dtype=int)
+        order = np.argsort(sources, kind='stable')
+        A = Utilities.getSparseAdjacencyMatrix(g2)[order,:][:,order]
+        sources = sources[order]
+        targets = targets[order]
+
+        chunks = [ (i, min(i+chunk_size, len(order))) for i in range(0, len(order), chunk_size) ]
+
+        if workers > 1 and len(chunks) > 1:
+            pool = multiprocessing.Pool(workers, initializer=initSecondOrderProjection, initargs=(A, sources, targets, n))
+            try:
+                results = pool.imap(projectSecondOrderDistances, chunks)
+                for s, D_s in results:
+                    np.minimum.at(D, s, D_s)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            initSecondOrderProjection(A, sources, targets, n)
+            for chunk in chunks:
+                s, D_s = projectSecondOrderDistances(chunk)
+                np.minimum.at(D, s, D_s)
+            secondOrderProjection.clear()
+
     np.fill_diagonal(D, 0)
+    return D
+
+
+class DepartureProfile(object):
+    """A sliding window over the departures of a single node, used in the reverse-time 
+    sweep of GetMinTemporalDistance. Each departure at time ts is stored together with a 
+    vector of the minimal number of hops needed to reach every node via time-respecting 
+    paths that leave the node at time ts. Since the sweep visits time stamps in decreasing 
+    order, departures are added at the back and expire at the front of the window, which 
+    is implemented as a queue of two stacks that maintain running minima. This allows to 
+    query the element-wise minimum over all departures in the window in amortized O(N). 
+    The forward sweep of sweepTemporalArrivals uses the same window for arrivals, whose 
+    time stamps are negated."""
+
+    def __init__(self, window=None):
+        """Creates an empty profile
+
+        @param window: if given, departures at times ts' >= ts + window are discarded when a 
+            departure at time ts is added, which requires that all subsequent queries use 
+            t_max < ts + window. This bounds the size of the profile by the departures within 
+            the window, even if the profile is never queried.
+        """
+        self.window = window
+        self.pending = deque()
+        self.back = []
+        self.back_min = None
+        self.front = []
+
+
+    def add(self, ts, hops):
+        """Adds a departure at time ts, which must be smaller than the time stamps of all 
+        departures added before"""
+        if self.window is not None:
+            self.expire(ts + self.window)
+        self.pending.append((ts, hops))
+
+
+    def shift(self):
+        """Moves the back stack to the front, computing minima from newest to oldest"""
+        running = None
+        for ts, hops in reversed(self.back):
+            running = hops if running is None else np.minimum(running, hops)
+            self.front.append((ts, running))
+        self.back = []
+        self.back_min = None
+
+
+    def expire(self, t_max):
+        """Discards all departures at times ts >= t_max. Since departures in the front stack 
+        are older than those in the back stack, which are older than pending ones, the back 
+        stack and pending departures are only checked once the front stack is empty."""
+        while True:
+            while len(self.front) > 0 and self.front[-1][0] >= t_max:
+                self.front.pop()
+            if len(self.front) > 0 or len(self.back) == 0 or self.back[0][0] < t_max:
+                break
+            self.shift()
+        if len(self.front) == 0 and len(self.back) == 0:
+            while len(self.pending) > 0 and self.pending[0][0] >= t_max:
+                self.pending.popleft()
+
+
+    def query(self, t_min, t_max):
+        """Returns the element-wise minimum of the hop vectors of all departures with 
+        t_min <= ts < t_max, or None if there is no such departure. Subsequent queries 
+        must use non-increasing values of t_min and t_max."""
+
+        # Departures become eligible once the window has moved down to their time stamp
+        while len(self.pending) > 0 and self.pending[0][0] >= t_min:
+            ts, hops = self.pending.popleft()
+            self.back.append((ts, hops))
+            self.back_min = hops if self.back_min is None else np.minimum(self.back_min, hops)
+
+        # Drop expired departures from the front of the window
+        self.expire(t_max)
+        if len(self.front) == 0:
+            if len(self.back) == 0:
+                return None
+            self.shift()
+
+        if self.back_min is None:
+            return self.front[-1][1]
+        return np.minimum(self.front[-1][1], self.back_min)
+
+
+def sweepMinTemporalDistances(store, delta=1, targets=None, workers=1):
+    """Computes the minimum temporal distances between all pairs of nodes in an edge store, 
+    in a single pass over the time-stamped edges in reverse order of time. For every node, 
+    the sweep maintains the profile of departures within a window of size delta, along 
+    with the hop counts of shortest time-respecting paths that start with these departures. 
+    An edge (v,w) at time ts continues all paths that leave w at time ts' with 
+    ts+1 <= ts' < ts+1+delta. This returns a matrix whose rows and columns correspond to 
+    node ids in the edge store.
+
+    @param store: the EdgeStore containing the time-stamped edges 
+    @param delta: the maximum waiting time of time-respecting paths
+    @param targets: an optional array of target node ids. If given, only the distances to 
+        these nodes are computed, and the columns of the returned matrix correspond to targets. 
+        Since hop counts to different targets are independent, this allows to split the sweep 
+        into blocks of columns.
+    @param workers: the number of processes to use. For workers > 1, blocks of target nodes 
+        are processed by a pool of processes.
+    """
+
+    n = store.vcount()
+    if workers > 1 and targets is None and n > 1:
+        blocks = np.array_split(np.arange(n), min(workers, n))
+        return np.hstack(list(mapTemporalPathSearch(sweepMinTemporalDistanceColumns, blocks, workers, store=store, delta=delta)))
+    if targets is None:
+        targets = np.arange(n)
+    m = len(targets)
+    column = np.zeros(n, dtype=np.int64)
+    column.fill(-1)
+    column[targets] = np.arange(m)
+
+    D = np.zeros(shape=(n,m))
+    D.fill(np.inf)
+
+    times, ptr = store.getTimeIndex()
+    # Later queries for edges at times ts' < ts use t_max = ts'+1+delta < ts+1+delta
+    profiles = [ DepartureProfile(delta+1) for v in range(n) ]
+    unreachable = np.zeros(m)
+    unreachable.fill(np.inf)
+
+    for i in range(len(times)-1, -1, -1):
+        ts = times[i]
+        sources = store.sources[ptr[i]:ptr[i+1]]
+        succ, inverse = np.unique(store.targets[ptr[i]:ptr[i+1]], return_inverse=True)
+
+        # Hop counts of shortest paths continuing after each target node 
+        H = np.empty((len(succ), m))
+        for j, w in enumerate(succ):
+            hops = profiles[w].query(ts+1, ts+1+delta)
+            H[j] = unreachable if hops is None else hops
+        H += 1
+        hit = column[succ] >= 0
+        H[np.flatnonzero(hit), column[succ[hit]]] = 1
+
+        # Combine all edges leaving the same node at time ts into a single departure
+        order = np.argsort(sources, kind='stable')
+        pred, starts = np.unique(sources[order], return_index=True)
+        R = np.minimum.reduceat(H[inverse[order]], starts, axis=0)
+        for j, v in enumerate(pred):
+            profiles[v].add(ts, R[j])
+        D[pred] = np.minimum(D[pred], R)
+
+    D[targets, np.arange(m)] = 0
+    return D
+
+
+class TemporalPathIndex(object):
+    """An index of the time-respecting continuations of all time-stamped edges, which is used 
+    to search shortest time-respecting paths in the graph of (node, arrival time) states. An 
+    edge (v,w) at time ts leads to the state (w, ts+1), from which all edges (w,x) at times 
+    ts' with ts+1 <= ts' < ts+1+delta can be followed. States are identified by slots, i.e. 
+    distinct pairs of target nodes and time stamps of edges. Multiple edges between the same 
+    pair of nodes at the same time stamp are counted once."""
 
-    sep = t.separator
+    def __init__(self, t, delta=1):
+        """Builds the index for a temporal network t and a maximum waiting time delta 
+
+        @param t: the temporal network to index
+        @param delta: the maximum waiting time of time-respecting paths
+        """
+
+        store = t.getEdgeStore()
+        self.delta = delta
+        self.names = store.names
+        self.n = store.vcount()
+        self.times, ptr = store.getTimeIndex()
+        T = len(self.times) + 1
+
+        # Distinct edges, ordered by source node and time
+        ranks = np.repeat(np.arange(len(self.times), dtype=np.int64), np.diff(ptr))
+        keys = np.unique((store.sources.astype(np.int64) * T + ranks) * self.n + store.targets)
+        self.out_keys = keys // self.n
+        targets = keys % self.n
+        ranks = self.out_keys % T
+
+        # Slots of (node, arrival time) states reached via edges
+        slot_keys, self.edge_slot = np.unique(targets * T + ranks, return_inverse=True)
+        self.slot_node = slot_keys // T
+        self.slot_time = self.times[slot_keys % T] + 1
+
+        # For each slot, the range of edges continuing a time-respecting path
+        self.slot_lo, self.slot_hi = self.getContinuations(self.slot_node, self.slot_time)
+
+
+    def getContinuations(self, nodes, arrival):
+        """Returns two arrays lo, hi such that the edges at positions lo[i]:hi[i] continue
+        time-respecting paths which arrive at node nodes[i] at time arrival[i]"""
+        T = len(self.times) + 1
+        lo = np.searchsorted(self.times, arrival, 'left')
+        hi = np.searchsorted(self.times, arrival + self.delta, 'left')
+        base = nodes.astype(np.int64) * T
+        return np.searchsorted(self.out_keys, base + lo), np.searchsorted(self.out_keys, base + hi)
+
+
+    def getStartTimes(self, v):
+        """Returns the array of those time stamps in the network at which a time-respecting 
+        path starting in node v (given by its id in the edge store) can be continued by an edge"""
+        T = len(self.times) + 1
+        lo, hi = np.searchsorted(self.out_keys, [v*T, (v+1)*T])
+        departures = self.times[self.out_keys[lo:hi] % T]
+        j = np.searchsorted(departures, self.times, 'left')
+        valid = j < len(departures)
+        valid[valid] = departures[j[valid]] < self.times[valid] + self.delta
+        return self.times[valid]
+
+
+    def search(self, v, start_t):
+        """Performs a breadth-first search of shortest time-respecting paths starting in 
+        node v (given by its id in the edge store) at time start_t. This returns a list 
+        of levels, where the k-th entry is a tuple (slots, sigma, parents, children). 
+        slots are the states at distance k, sigma the number of shortest paths leading 
+        to them, and the arrays parents, children contain the edges between levels k-1 
+        and k of the shortest path DAG. For level zero, which contains the start state 
+        only, slots is [-1]."""
+
+        lo, hi = self.getContinuations(np.array([v]), np.array([start_t]))
+        levels = [ (np.array([-1]), np.ones(1), None, None) ]
+        dist = np.zeros(len(self.slot_node), dtype=np.int64)
+        dist.fill(-1)
+
+        k = 0
+        while True:
+            counts = hi - lo
+            total = counts.sum()
+            if total == 0:
+                break
+            parents = np.repeat(np.arange(len(lo)), counts)
+            positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+            slots = self.edge_slot[positions]
+
+            # Only states reached for the first time are on shortest paths
+            new = dist[slots] < 0
+            if not new.any():
+                break
+            parents = parents[new]
+            slots, children = np.unique(slots[new], return_inverse=True)
+            k += 1
+            dist[slots] = k
+            sigma = np.bincount(children, weights=levels[-1][1][parents], minlength=len(slots))
+            levels.append( (slots, sigma, parents, children) )
+            lo = self.slot_lo[slots]
+            hi = self.slot_hi[slots]
+        return levels
+
+
+    def getReachable(self, levels):
+        """Returns a tuple (nodes, dist) of arrays, which contain the ids of all nodes reached
+        by a search (in ascending order) and the lengths of shortest time-respecting paths to 
+        them. The start node is only contained if it can be reached via a path of length > 0."""
+        if len(levels) == 1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        nodes = np.concatenate([ self.slot_node[levels[k][0]] for k in range(1, len(levels)) ])
+        dist = np.repeat(np.arange(1, len(levels)), [ len(levels[k][0]) for k in range(1, len(levels)) ])
+        # The first occurrence of a node is at the level of its shortest path length
+        nodes, first = np.unique(nodes, return_index=True)
+        return nodes, dist[first]
+
+
+    def getDistances(self, levels):
+        """Returns an array with the lengths of shortest time-respecting paths to all nodes,
+        where unreachable nodes are indicated by np.inf. The distance of the start node
+        is not set."""
+        d = np.zeros(self.n)
+        d.fill(np.inf)
+        nodes, dist = self.getReachable(levels)
+        d[nodes] = dist
+        return d
+
+
+    def accumulate(self, levels, target_dist, bw):
+        """Accumulates the number of shortest time-respecting paths which pass through nodes 
+        in the array bw. Paths end in any state of a node w at level target_dist[w], the start 
+        state of a search does not count as a node on a path.
+
+        @param levels: the levels of a search as returned by search
+        @param target_dist: an array containing the path lengths to be considered for each target node
+        @param bw: the array to which the counts of all nodes are added
+        """
+        c = None
+        for k in range(len(levels)-1, 0, -1):
+            slots, sigma, parents, children = levels[k]
+            nodes = self.slot_node[slots]
+            term = (target_dist[nodes] == k).astype(np.float64)
+            below = np.zeros(len(slots))
+            if c is not None:
+                below = np.bincount(c[1], weights=c[0][c[2]], minlength=len(slots))
+            bw += np.bincount(nodes, weights=sigma * below, minlength=self.n)
+            c = (term + below, parents, children)
+
+
+    def getPaths(self, levels, v, start_t, target_dist, max_paths=None):
+        """Returns a dictionary which maps node ids w to lists of shortest time-respecting paths 
+        with length target_dist[w], each being a list of (node, time) tuples starting with 
+        (v, start_t). At most max_paths paths will be collected for each node.
+
+        @param levels: the levels of a search as returned by search
+        @param v: the id of the start node 
+        @param start_t: the start time of the search
+        @param target_dist: an array containing the path lengths to be considered for each target node
+        @param max_paths: the maximum number of paths to collect per target node. If None, all 
+            paths are collected.
+        """
+
+        # The parents of each state, indexed by level
+        parents = [ None ]
+        for k in range(1, len(levels)):
+            order = np.argsort(levels[k][3], kind='stable')
+            ptr = np.zeros(len(levels[k][0])+1, dtype=np.int64)
+            np.cumsum(np.bincount(levels[k][3], minlength=len(levels[k][0])), out=ptr[1:])
+            parents.append( (levels[k][2][order].tolist(), ptr.tolist()) )
+
+        def prefixes(k, i, limit):
+            if k == 0:
+                return [ [(self.names[v], start_t)] ]
+            slot = levels[k][0][i]
+            state = (self.names[self.slot_node[slot]], self.slot_time[slot].item())
+            found = []
+            p, ptr = parents[k]
+            for j in range(ptr[i], ptr[i+1]):
+                for prefix in prefixes(k-1, p[j], None if limit is None else limit-len(found)):
+                    found.append(prefix + [state])
+                if limit is not None and len(found) >= limit:
+                    break
+            return found
+
+        paths = defaultdict( lambda: [] )
+        for k in range(1, len(levels)):
+            nodes = self.slot_node[levels[k][0]]
+            for i in np.flatnonzero(target_dist[nodes] == k):
+                w = nodes[i]
+                limit = None if max_paths is None else max_paths - len(paths[w])
+                if limit is None or limit > 0:
+                    paths[w] += prefixes(k, i, limit)
+        return paths
+
+
+def sweepTemporalArrivals(store, delta=1, sources=None, start_t=None):
+    """Computes the lengths of shortest time-respecting paths from a batch of source nodes to 
+    all nodes in an edge store, in a single forward pass over the time-stamped edges. For every 
+    node, the sweep maintains the arrivals within a window of size delta, along with vectors of 
+    the hop counts of shortest time-respecting paths from all sources arriving at that time. An 
+    edge (v,w) at time ts continues all paths arriving in v at time a with a <= ts < a+delta and 
+    arrives in w at time ts+1. This returns a matrix whose rows correspond to node ids in the edge 
+    store and whose columns correspond to sources.
+
+    @param store: the EdgeStore containing the time-stamped edges 
+    @param delta: the maximum waiting time of time-respecting paths
+    @param sources: an array of distinct source node ids (default all nodes)
+    @param start_t: the start time of time-respecting paths. If None, paths can start at any 
+        time, which yields minimum temporal distances (see GetMinTemporalDistance).
+    """
+
+    n = store.vcount()
+    if sources is None:
+        sources = np.arange(n)
+    m = len(sources)
+    column = np.zeros(n, dtype=np.int64)
+    column.fill(-1)
+    column[sources] = np.arange(m)
+
+    D = np.zeros(shape=(n,m))
+    D.fill(np.inf)
+    D[sources, np.arange(m)] = 0
+
+    times, ptr = store.getTimeIndex()
+    # Arrivals at time a are stored as -a, and later queries for edges at times ts > a-1 
+    # use t_max = -ts+delta < -a+1+delta
+    profiles = [ DepartureProfile(delta+1) for v in range(n) ]
+    unreachable = np.zeros(m)
+    unreachable.fill(np.inf)
+
+    first = 0
+    if start_t is not None:
+        first = np.searchsorted(times, start_t, 'left')
+        for j, v in enumerate(sources):
+            hops = unreachable.copy()
+            hops[j] = 0
+            profiles[v].add(-start_t, hops)
+
+    for i in range(first, len(times)):
+        ts = times[i]
+        pred, inverse = np.unique(store.sources[ptr[i]:ptr[i+1]], return_inverse=True)
+        targets = store.targets[ptr[i]:ptr[i+1]]
+
+        # Hop counts of shortest paths arriving in each source node in time
+        H = np.empty((len(pred), m))
+        for j, v in enumerate(pred):
+            hops = profiles[v].query(-ts, -ts+delta)
+            H[j] = unreachable if hops is None else hops
+        H += 1
+        if start_t is None:
+            hit = column[pred] >= 0
+            H[np.flatnonzero(hit), column[pred[hit]]] = 1
+
+        # Combine all edges arriving in the same node at time ts+1 into a single arrival
+        order = np.argsort(targets, kind='stable')
+        succ, starts = np.unique(targets[order], return_index=True)
+        R = np.minimum.reduceat(H[inverse[order]], starts, axis=0)
+        reached = np.isfinite(R).any(axis=1)
+        for j in np.flatnonzero(reached):
+            profiles[succ[j]].add(-(ts+1), R[j])
+        D[succ[reached]] = np.minimum(D[succ[reached]], R[reached])
 
-    for v in g2.vs()["name"]:
-        source = v.split(sep)[0]
-        for w in g2.vs()["name"]:
-            target = w.split(sep)[1]
-            X = g2.get_shortest_paths(v,w)            
-            for p in X:
-                if len(p)>0:
-                    D[name_map[source], name_map[target]] = min(len(p), D[name_map[source], name_map[target]])
     return D
 
 
-def GetMinTemporalDistance(t, delta=1, collect_paths=True):
+"""Data shared with the worker processes of temporal path searches"""
+temporalPathSearch = {}
+
+
+def initTemporalPathSearch(index=None, D=None, store=None, delta=1):
+    """Initializes the data used by searchTemporalDistances, accumulateTemporalBetweenness and
+    sweepMinTemporalDistanceColumns in a (worker) process
+
+    @param index: the TemporalPathIndex to search 
+    @param D: an optional matrix of minimum temporal distances between nodes (by node ids)
+    @param store: the EdgeStore used for sweeps
+    @param delta: the maximum waiting time used for sweeps
+    """
+    temporalPathSearch['index'] = index
+    temporalPathSearch['D'] = D
+    temporalPathSearch['store'] = store
+    temporalPathSearch['delta'] = delta
+
+
+def sweepMinTemporalDistanceColumns(targets):
+    """Computes minimum temporal distances to a block of target nodes (see sweepMinTemporalDistances)"""
+    return sweepMinTemporalDistances(temporalPathSearch['store'], temporalPathSearch['delta'], targets)
+
+
+def searchTemporalDistances(chunk):
+    """Searches shortest time-respecting paths from a range of source nodes. The chunk is 
+    a tuple (v_from, v_to, start_t, max_paths, collect_paths). This returns a list of tuples 
+    (nodes, dist, paths) for all sources v_from <= v < v_to (see TemporalPathIndex.getReachable 
+    and TemporalPathIndex.getPaths), where paths is None unless collect_paths is True."""
+    index = temporalPathSearch['index']
+    v_from, v_to, start_t, max_paths, collect_paths = chunk
+    results = []
+    for v in range(v_from, v_to):
+        levels = index.search(v, start_t)
+        nodes, dist = index.getReachable(levels)
+        paths = None
+        if collect_paths == True:
+            d = np.zeros(index.n)
+            d.fill(np.inf)
+            d[nodes] = dist
+            d[v] = 0
+            paths = dict(index.getPaths(levels, v, start_t, d, max_paths))
+        results.append( (nodes, dist, paths) )
+    return results
+
+
+def collectMinTemporalPaths(chunk):
+    """Collects shortest time-respecting paths with minimum temporal distance, across all start 
+    times, from a range of source nodes. The chunk is a tuple (v_from, v_to, max_paths). This 
+    returns a list with one dictionary per source, which maps target ids to lists of paths."""
+    index = temporalPathSearch['index']
+    D = temporalPathSearch['D']
+    v_from, v_to, max_paths = chunk
+    results = []
+    for v in range(v_from, v_to):
+        collected = defaultdict( lambda: [] )
+        for start_t in index.getStartTimes(v):
+            paths = index.getPaths(index.search(v, start_t), v, start_t.item(), D[v], max_paths)
+            for w in paths:
+                P = collected[w]
+                P += paths[w][:len(paths[w]) if max_paths is None else max_paths - len(P)]
+        results.append(dict(collected))
+    return results
+
+
+def accumulateTemporalBetweenness(chunk):
+    """Counts the shortest time-respecting paths passing through each node for a range of 
+    source nodes. The chunk is a tuple (v_from, v_to, start_t). If start_t is None, paths 
+    starting at all possible start times are considered, whose lengths are given by the 
+    minimum temporal distances D. Otherwise, shortest paths starting at time start_t are 
+    considered. This returns an array of counts indexed by node ids."""
+    index = temporalPathSearch['index']
+    D = temporalPathSearch['D']
+    v_from, v_to, start_t = chunk
+    counts = np.zeros(index.n)
+    for v in range(v_from, v_to):
+        if start_t is None:
+            for ts in index.getStartTimes(v):
+                index.accumulate(index.search(v, ts), D[v], counts)
+        else:
+            levels = index.search(v, start_t)
+            d = index.getDistances(levels)
+            d[v] = 0
+            index.accumulate(levels, d, counts)
+    return counts
+
+
+def accumulateTemporalCloseness(chunk):
+    """Accumulates the reciprocal lengths of shortest time-respecting paths from a range of 
+    source nodes to all other nodes. The chunk is a tuple (v_from, v_to, start_t), where 
+    start_t = None considers paths starting at any time (see sweepTemporalArrivals). This 
+    returns an array of closeness contributions indexed by node ids."""
+    v_from, v_to, start_t = chunk
+    sources = np.arange(v_from, v_to)
+    D = sweepTemporalArrivals(temporalPathSearch['store'], temporalPathSearch['delta'], sources, start_t)
+    D[sources, np.arange(len(sources))] = np.inf
+    return (1./D).sum(axis=1)
+
+
+def sampleTemporalBetweenness(samples):
+    """Counts the shortest time-respecting paths passing through each node, for a list of sampled 
+    pairs (v, start_t) of source node ids and start times. Paths are considered if their length 
+    is the minimum temporal distance between their end points (see GetTemporalBetweenness). This 
+    returns a tuple (s, q, nonzero, peak), where s and q are arrays containing the sums and the sums 
+    of squares of the counts of all samples, indexed by node ids, nonzero is the number of samples 
+    with a non-zero count for any node, and peak is the largest count of a node in a single sample."""
+    index = temporalPathSearch['index']
+    s = np.zeros(index.n)
+    q = np.zeros(index.n)
+    nonzero = 0
+    peak = 0.
+
+    # Minimum temporal distances from all distinct sampled sources in a single sweep
+    sources, column = np.unique([ v for v, start_t in samples ], return_inverse=True)
+    D = sweepTemporalArrivals(temporalPathSearch['store'], index.delta, sources)
+    for j, (v, start_t) in enumerate(samples):
+        counts = np.zeros(index.n)
+        index.accumulate(index.search(v, start_t), D[:,column[j]], counts)
+        s += counts
+        q += counts * counts
+        if counts.any():
+            nonzero += 1
+            peak = max(peak, counts.max())
+    return s, q, nonzero, peak
+
+
+def sampleTemporalCloseness(sources):
+    """Computes the reciprocal minimum temporal distances from an array of sampled source node ids 
+    to all other nodes. This returns a tuple (s, q, nonzero, peak) as sampleTemporalBetweenness, 
+    where values are the reciprocal distances from the sampled sources."""
+    D = sweepTemporalArrivals(temporalPathSearch['store'], temporalPathSearch['delta'], sources)
+    D[sources, np.arange(len(sources))] = np.inf
+    X = 1./D
+    return X.sum(axis=1), (X*X).sum(axis=1), int(X.any(axis=0).sum()), X.max(initial=0.)
+
+
+def mapTemporalPathSearch(function, chunks, workers=1, **kwargs):
+    """Applies a worker function to a list of chunks, and yields the results in the order of 
+    chunks. For workers > 1, chunks are processed by a pool of processes which share the 
+    search data read-only.
+
+    @param function: one of the worker functions of temporal path searches
+    @param chunks: the list of arguments for the worker function
+    @param workers: the number of processes to use
+    @param kwargs: the data passed to initTemporalPathSearch
+    """
+    if workers > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(min(workers, len(chunks)), initializer=initTemporalPathSearch, initargs=(
+            kwargs.get('index'), kwargs.get('D'), kwargs.get('store'), kwargs.get('delta', 1)))
+        try:
+            for result in pool.imap(function, chunks):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        initTemporalPathSearch(**kwargs)
+        try:
+            for chunk in chunks:
+                yield function(chunk)
+        finally:
+            temporalPathSearch.clear()
+
+
+"""The maximum number of source nodes whose search results are returned by searchTemporalDistances at once"""
+rowChunkSize = 64
+
+
+def getSourceChunks(n, workers=1, max_size=None):
+    """Returns a list of ranges (v_from, v_to) splitting n source nodes into blocks for the given 
+    number of workers
+
+    @param n: the number of source nodes
+    @param workers: the number of processes
+    @param max_size: an optional maximum number of source nodes per block. This bounds the 
+        memory of worker functions which return results per source node (see searchTemporalDistances).
+    """
+    size = max(1, -(-n // (4 * workers))) if workers > 1 else max(n, 1)
+    if max_size is not None:
+        size = min(size, max_size)
+    return [ (i, min(i+size, n)) for i in range(0, n, size) ]
+
+
+def GetMinTemporalDistance(t, delta=1, collect_paths=False, max_paths=100, workers=1):
     """ Computes the minimum temporal distance between all pairs of nodes in 
         terms of time-respecting paths (using a given maximum time difference delta), 
-        across all possible starting times in the temporal network
+        across all possible starting times in the temporal network. Distances are 
+        computed in a single reverse-time sweep over the time-stamped edges, which 
+        requires O(E*N) time in total.
 
         @param t: the temporal network to calculate the distance for
         @param delta: the maximum waiting time to be used for the definition of time-respecting paths.
             Note that this is independent of the delta parameter set in the temporal networks instancd
            for the two-path extraction
-        @param collect_paths: whether or not to return all shortest time-respecting paths. If False, only 
-            shortest path distances will be returned.
+        @param collect_paths: whether or not to return shortest time-respecting paths (default False). If False, only 
+            shortest path distances will be returned. Note that collecting paths requires a separate 
+            search for each possible start time.
+        @param max_paths: the maximum number of shortest time-respecting paths collected for each 
+            pair of nodes (default 100). If None, all paths are collected, whose number can grow 
+            exponentially.
+        @param workers: the number of processes to use. For workers > 1, the sweep is split 
+            into blocks of target nodes, and paths are collected for blocks of source nodes 
+            in a pool of processes.
     """
 
     Log.add('Computing minimum temporal distances for delta = ' + str(int(delta)) + ' ...')
 
     name_map = Utilities.firstOrderNameMap( t )
 
+    store = t.getEdgeStore()
+    ix = np.array([ name_map[v] for v in store.names ], dtype=int)
+    D = sweepMinTemporalDistances(store, delta, workers=workers)
+
     minD = np.zeros(shape=(len(t.nodes),len(t.nodes)))
     minD.fill(np.inf)
+    minD[np.ix_(ix, ix)] = D
 
     # Each node is connected to itself via a path of length zero
     np.fill_diagonal(minD, 0)
 
     minPaths = defaultdict( lambda: defaultdict( lambda: [] ) )
 
-    for start_t in t.ordered_times:
-        D, paths = GetTemporalDistanceMatrix(t, start_t, delta, collect_paths)
-        for v in t.nodes:
-            for w in t.nodes:
-                if D[name_map[v], name_map[w]] < minD[name_map[v], name_map[w]]:
-                    minD[name_map[v], name_map[w]] = D[name_map[v], name_map[w]]
-                    minPaths[v][w] = paths[v][w]
-                elif D[name_map[v], name_map[w]] == minD[name_map[v], name_map[w]] and minD[name_map[v], name_map[w]] < np.inf:
-                    for p in paths[v][w]:
-                        if p not in minPaths[v][w]:
-                            minPaths[v][w] = minPaths[v][w] + [p]
+    if collect_paths == True:
+        index = TemporalPathIndex(t, delta)
+        chunks = [ (v_from, v_to, max_paths) for v_from, v_to in getSourceChunks(index.n, workers) ]
+        v = 0
+        for results in mapTemporalPathSearch(collectMinTemporalPaths, chunks, workers, index=index, D=D):
+            for paths in results:
+                for w in paths:
+                    minPaths[index.names[v]][index.names[w]] = paths[w]
+                v += 1
     Log.add('finished.')
     return minD, minPaths
 
 
-def GetTemporalDistanceMatrix(t, start_t=-1, delta=1, collect_paths=True):
+def GetTemporalDistanceRows(t, start_t=-1, delta=1, dtype=np.uint16, workers=1):
+    """Calculates the lengths of shortest time-respecting paths starting at time start_t from 
+    each node to all nodes reachable from it (see GetTemporalDistanceMatrix), and yields one 
+    tuple (i, targets, distances) per source node. Here, i is the index of the source node, 
+    targets is an array containing the indices of all reachable nodes (including i) in 
+    ascending order and distances is an array of the corresponding path lengths. Indices 
+    correspond to the ordering of nodes in the vertex sequence of the igraph first order 
+    time-aggregated network. Since unreachable nodes are omitted, this allows to process 
+    temporal distances in large networks without allocating an N x N matrix.
+
+    @param t: the temporal network to calculate shortest time-respecting paths for
+    @param start_t: the start time for which to consider time-respecting paths (default is t.ordered_times[0])
+    @param delta: the maximum time difference to be used in the time-respecting path definition (default 1)
+    @param dtype: the integer dtype of the returned distances (default np.uint16)
+    @param workers: the number of processes to use. For workers > 1, searches from blocks of 
+        source nodes are distributed across a pool of processes.
+    """
+
+    if start_t == -1:
+        start_t = t.ordered_times[0]
+
+    name_map = Utilities.firstOrderNameMap( t )
+
+    index = TemporalPathIndex(t, delta)
+    ix = np.array([ name_map[v] for v in index.names ], dtype=np.int32)
+
+    # Small blocks, such that only the results of one block are held at once 
+    chunks = [ (v_from, v_to, start_t, None, False) for v_from, v_to in getSourceChunks(index.n, workers, rowChunkSize) ]
+    v = 0
+    for results in mapTemporalPathSearch(searchTemporalDistances, chunks, workers, index=index):
+        for nodes, dist, paths in results:
+            keep = nodes != v
+            targets = np.append(ix[nodes[keep]], ix[v])
+            distances = np.append(dist[keep], 0).astype(dtype)
+            order = np.argsort(targets)
+            yield (ix[v], targets[order], distances[order])
+            v += 1
+
+
+def GetTemporalDistanceMatrix(t, start_t=-1, delta=1, collect_paths=False, max_paths=100, output='dense', dtype=np.float64, workers=1):
     """A new and faster method to compute the (topologically) shortest time-respecting paths between 
     all pairs of nodes starting at time start_t in an empirical temporal network t.
     This function returns a tuple consisting of 
@@ -138,19 +887,33 @@ def GetTemporalDistanceMatrix(t, start_t=-1, delta=1, collect_paths=True):
             pairs of nodes. The ordering of rows/columns corresponds to the ordering of nodes 
             in the vertex sequence of the igraph first order time-aggregated network. A
             mapping between nodes and indices can be found in Utilities.firstOrderNameMap().
-        2) a list of shortest time-respecting paths, each entry being an ordered sequence 
-            of nodes on the corresponding path.
+            Depending on the parameter output, D is either a dense numpy array or a scipy 
+            sparse matrix, which only stores the path lengths of reachable pairs of distinct 
+            nodes.
+        2) a dictionary of shortest time-respecting paths, each entry being an ordered sequence 
+            of (node, time) tuples on the corresponding path. This is empty unless collect_paths is True.
     
     @param t: the temporal network to calculate shortest time-respecting paths for
     @param start_t: the start time for which to consider time-respecting paths (default is t.ordered_times[0])
     @param delta: the maximum time difference to be used in the time-respecting path definition (default 1).
         Note that this parameter is independent from the internal parameter delta used for two-path extraction
         in the class TemporalNetwork
-    @param collect_paths: whether or not to collect all shortest time-respecting paths (default = True). If this is 
+    @param collect_paths: whether or not to collect shortest time-respecting paths (default = False). If this is 
         set to False, the method will only compute the lengths of shortest time-respecting paths, but not return the actual 
         paths.
+    @param max_paths: the maximum number of shortest time-respecting paths collected for each 
+        pair of nodes (default 100). If None, all paths are collected, whose number can grow 
+        exponentially.
+    @param output: either C{"dense"} (default), C{"coo"} or C{"csr"}. For the sparse formats C{"coo"} 
+        and C{"csr"}, no N x N matrix is allocated and unreachable pairs of nodes are not stored. 
+        Use GetTemporalDistanceRows to process distances for one source node at a time.
+    @param dtype: the dtype of D, e.g. np.uint16 to save memory (see convertDistances)
+    @param workers: the number of processes to use. For workers > 1, searches from blocks of 
+        source nodes are distributed across a pool of processes.
         """
 
+    assert output == 'dense' or output == 'coo' or output == 'csr'
+
     if start_t == -1:
         start_t = t.ordered_times[0]
 
@@ -160,64 +923,40 @@ def GetTemporalDistanceMatrix(t, start_t=-1, delta=1, collect_paths=True):
     # Get a mapping between node names and matrix indices
     name_map = Utilities.firstOrderNameMap( t )
 
-    # Initialize topological distance matrix
-    # TODO: This may yield a memory problem for large graphs 
-    D = np.zeros(shape=(len(t.nodes),len(t.nodes)))
-    D.fill(np.inf)
-
-    # For each node v, calculate shortest/fastest paths to all other nodes ... 
-    for v in t.nodes:
-        
-        # Mark node v as visited at the start time start_t... 
-        D[name_map[v], name_map[v]] = 0        
-        Paths[v][v] = [ [(v,start_t)] ]
-
-        stack = set([ (v, start_t) ])
-        
-        # While there are nodes, which could possibly continue a time-respecting path
-        while len(stack)>0:
-
-            (x,ts) = stack.pop()
-
-            # Get indices of time range within which a time-respecting path via x 
-            # can possibly be continued
-            min_ix = bisect_left(t.activities[x], ts)
-            max_ix = bisect_left(t.activities[x], ts+delta)-1
-
-            # For all time-stamps at which x is a source node ... 
-            for j in range(min_ix, max_ix+1):
-                time = t.activities[x][j]
-
-                # For all edges starting at node x at this time
-                for e in t.sources[time][x]:
-
-                    # We found a new node on a time-respecting path
-                    new_node = (e[1], time+1)
-                    
-                    # This node can again continue time-respecting paths
-                    # The set will take care that no duplicates are recorded
-                    stack.add( new_node )
-
-                    # Check whether we found a time-respecting path shorter than the current shortest one ... 
-                    if D[name_map[v], name_map[e[1]]] > D[name_map[v], name_map[e[0]]] + 1:
-                        
-                        # In this case we update the distance matrix
-                        D[name_map[v], name_map[e[1]]] = D[name_map[v], name_map[e[0]]] + 1
-
-                        if collect_paths == True:
-                            # Delete any previous shortest paths 
-                            Paths[v][e[1]] = []
-
-                            # Collect all paths to e[0] and concatenate with the current node e[1]
-                            for p in Paths[v][e[0]]:
-                                Paths[v][e[1]] = Paths[v][e[1]] + [p + [(e[1],time+1)]]
-
-                    # We may also have found a path that has the same length as other shortest paths ...
-                    elif collect_paths == True and D[name_map[v], name_map[e[1]]] == D[name_map[v], name_map[e[0]]] + 1:
-
-                        # Collect all paths to e[0] and concatenate with the current node e[1]
-                        for p in Paths[v][e[0]]:
-                            Paths[v][e[1]] = Paths[v][e[1]] + [p + [(e[1],time+1)]]
-        
-    # The algorithm terminates as soon as it is impossible to continue any of the time-respecting paths
-    return D, Paths
\ No newline at end of file
+    index = TemporalPathIndex(t, delta)
+    ix = np.array([ name_map[v] for v in index.names ], dtype=np.int32)
+
+    n = len(t.nodes)
+    rows = [ np.zeros(0, dtype=np.int32) ]
+    cols = [ np.zeros(0, dtype=np.int32) ]
+    data = [ np.zeros(0, dtype=dtype) ]
+    if output == 'dense':
+        D = np.zeros(shape=(n,n), dtype=dtype)
+        D.fill(np.inf if np.dtype(dtype).kind == 'f' else np.iinfo(dtype).max)
+
+    # For each node v, calculate shortest paths to all other nodes ... 
+    chunks = [ (v_from, v_to, start_t, max_paths, collect_paths) for v_from, v_to in getSourceChunks(index.n, workers, rowChunkSize) ]
+    v = 0
+    for results in mapTemporalPathSearch(searchTemporalDistances, chunks, workers, index=index):
+        for nodes, dist, paths in results:
+            keep = nodes != v
+            if output == 'dense':
+                D[ix[v], ix[nodes[keep]]] = dist[keep]
+                D[ix[v], ix[v]] = 0
+            else:
+                rows.append(np.repeat(ix[v], keep.sum()))
+                cols.append(ix[nodes[keep]])
+                data.append(dist[keep].astype(dtype))
+
+            if collect_paths == True:
+                for w in paths:
+                    Paths[index.names[v]][index.names[w]] = paths[w]
+                Paths[index.names[v]][index.names[v]] = [ [(index.names[v], start_t)] ]
+            v += 1
+
+    if output != 'dense':
+        D = sparse.coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(n,n))
+        if output == 'csr':
+            D = D.tocsr()
+
+    return D, Paths
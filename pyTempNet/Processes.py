@@ -18,17 +18,27 @@ import pyTempNet as tn
 from pyTempNet import Utilities
 from pyTempNet.Log import *
     
-def RWDiffusion(g, samples = 5, epsilon=0.01, max_iterations=100000):
+def RWDiffusion(g, samples = 5, epsilon=0.01, max_iterations=100000, model='SECOND'):
     """Computes the average number of steps requires by a random walk process
     to fall below a total variation distance below epsilon (TVD computed between the momentary 
     visitation probabilities \pi^t and the stationary distribution \pi = \pi^{\infty}. This time can be 
-    used to measure diffusion speed in a given (weighted and directed) network."""
+    used to measure diffusion speed in a given (weighted and directed) network.
+    
+    @param g: the network, or a temporal network instance. For a temporal network, diffusion is 
+        simulated in the strongly connected giant component of the second-order aggregate network, 
+        using the transition matrix and stationary distribution cached in the temporal network 
+        (see TemporalNetwork.getSpectralCache)
+    @param model: if g is a temporal network, either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}"""
     avg_speed = 0
     
-    T = Utilities.RWTransitionMatrix(g)
-    pi = Utilities.StationaryDistribution(T)
+    if isinstance(g, tn.TemporalNetwork):
+        T = g.getTransitionMatrix(model)
+        pi = g.getStationaryDistribution(model)
+    else:
+        T = Utilities.RWTransitionMatrix(g)
+        pi = Utilities.StationaryDistribution(T)
     
-    n = len(g.vs())
+    n = T.shape[0]
     for s in range(samples):
         x = np.zeros(n)
         seed = np.random.randint(n)
@@ -147,10 +157,10 @@ def exportRandomWalkMovieFramesFirstOrder(t, file_prefix='random_walk', visual_s
         g1_plot = g1    
 
     if model == 'SECOND':
-        g2 = t.igraphSecondOrder().components(mode='STRONG').giant()
+        g2 = t.igraphSecondOrder(names=False).components(mode='STRONG').giant()
         temporal = tn.TemporalNetwork.ShuffleTwoPaths(t)
     elif model == 'NULL':
-        g2 = t.igraphSecondOrderNull().components(mode='STRONG').giant()
+        g2 = t.igraphSecondOrderNull(names=False).components(mode='STRONG').giant()
         temporal = tn.TemporalNetwork.ShuffleEdges(t) 
 
     #T = Utilities.RWTransitionMatrix(g2)
@@ -178,20 +188,13 @@ def exportRandomWalkMovieFramesFirstOrder(t, file_prefix='random_walk', visual_s
 
     rw_position = initial_index
 
-    # This index allows to quickly map node names to indices in the first-order network
-    map_name_to_id = {}
-    for i in range(len(g1.vs())):
-        map_name_to_id[g1.vs()['name'][i]] = i
-    
     # Index to quickly map second-order node indices to first-order node indices
     map_2_to_1 = {}
+    targets = g2.vs["target"]
     for j in range(len(g2.vs())):
         # j is index of node in *second-order* network
-        # we first get the name of the *target* of the underlying edge
-        node = g2.vs()["name"][j].split(t.separator)[1]
-
-        # we map the target of second-order node j to the index of the *first-order* node
-        map_2_to_1[j] = map_name_to_id[node]   
+        # we map the *target* of the underlying edge to the index of the *first-order* node
+        map_2_to_1[j] = targets[j]   
 
     color_wheel=['green', 'red', 'orange','tomato']
     restart_ctr=0
@@ -250,8 +253,7 @@ def exportRandomWalkMovieFramesFirstOrder(t, file_prefix='random_walk', visual_s
                 probs = [g2.es()[g2.get_eid(rw_position, s)]["weight"] for s in successors]
                 probs = probs/np.sum(probs)
                 new = np.random.choice(a=successors, p=probs)
-                edge = g2.vs()[new]["name"].split(t.separator)
-                last_edge = g1.get_eid(g1.vs.find(edge[0]), g1.vs.find(edge[1]))
+                last_edge = g1.get_eid(g2.vs[new]["source"], g2.vs[new]["target"])
                 rw_position = new
             visit_counts[map_2_to_1[rw_position]] = visit_counts[map_2_to_1[rw_position]]+1
 
@@ -284,10 +286,10 @@ def exportDiffusionMovieFramesFirstOrder(t, file_prefix='diffusion', visual_styl
     g1 = t.igraphFirstOrder()
 
     if model == 'SECOND':
-        g2 = t.igraphSecondOrder()
+        g2 = t.igraphSecondOrder(names=False)
         temporal = tn.TemporalNetwork.ShuffleTwoPaths(t)
     elif model == 'NULL':
-        g2 = t.igraphSecondOrderNull()
+        g2 = t.igraphSecondOrderNull(names=False)
         temporal = tn.TemporalNetwork.ShuffleEdges(t) 
 
     T = Utilities.RWTransitionMatrix(g2)
@@ -311,20 +313,13 @@ def exportDiffusionMovieFramesFirstOrder(t, file_prefix='diffusion', visual_styl
     x = np.zeros(len(g2.vs()))
     x[initial_index] = 1
 
-    # This index allows to quickly map node names to indices in the first-order network
-    map_name_to_id = {}
-    for i in range(len(g1.vs())):
-        map_name_to_id[g1.vs()['name'][i]] = i
-    
     # Index to quickly map second-order node indices to first-order node indices
     map_2_to_1 = {}
+    targets = g2.vs["target"]
     for j in range(len(g2.vs())):
         # j is index of node in *second-order* network
-        # we first get the name of the *target* of the underlying edge
-        node = g2.vs()["name"][j].split(t.separator)[1]
-
-        # we map the target of second-order node j to the index of the *first-order* node
-        map_2_to_1[j] = map_name_to_id[node]
+        # we map the *target* of the underlying edge to the index of the *first-order* node
+        map_2_to_1[j] = targets[j]
 
     # compute stationary state of random walk process
     pi = Utilities.StationaryDistribution(T)
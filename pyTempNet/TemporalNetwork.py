@@ -8,12 +8,17 @@ Created on Thu Feb 19 11:49:39 2015
 
 import igraph
 import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sla
 from collections import defaultdict
 
+from bisect import bisect_left
 from bisect import bisect_right
 
 from pyTempNet.Utilities import RWTransitionMatrix
 from pyTempNet.Utilities import StationaryDistribution
+from pyTempNet.EdgeStore import EdgeStore
+from pyTempNet.EdgeStore import aggregateTwoPaths
 from pyTempNet.Log import *
 
 class EmptySCCError(Exception):
@@ -21,69 +26,127 @@ class EmptySCCError(Exception):
     connected component, but encounter an empty one"""
     pass
 
+def addEdgeWeights(g, sources, targets, weights):
+    """Adds weights to the edges (sources[i], targets[i]) of an igraph network g, 
+    creating edges that do not exist yet.
+
+    @param g: the igraph network whose edge weights shall be updated
+    @param sources: list of source vertex indices
+    @param targets: list of target vertex indices
+    @param weights: the weights to add
+    """
+    n = g.vcount()
+    weights = np.asarray(weights)
+    keys, inverse = np.unique(np.asarray(sources, dtype=np.int64) * n + np.asarray(targets, dtype=np.int64), return_inverse=True)
+    weights = np.bincount(inverse, weights=weights, minlength=len(keys)).astype(weights.dtype)
+    pairs = list(zip((keys // n).tolist(), (keys % n).tolist()))
+    eids = g.get_eids(pairs, error=False)
+
+    missing = []
+    for i, w in enumerate(weights.tolist()):
+        if eids[i] >= 0:
+            g.es[eids[i]]["weight"] += w
+        else:
+            missing.append(i)
+    if len(missing) > 0:
+        g.add_edges([pairs[i] for i in missing], attributes={"weight": weights[missing].tolist()})
+
+
 class TemporalNetwork:
     """A class representing a temporal network consisting of a sequence of time-stamped edges"""
     
-    def __init__(self,  sep=',', tedges = None, twopaths = None):
+    def __init__(self,  sep=',', tedges = None, twopaths = None, columnar = False, compact = False, workers = 1):
         """Constructor generating a temporal network instance
         
         @param sep: a separator character to be used for the naming of higher-order nodes v-w
         @param tedges: an optional list of (possibly unordered time-stamped) links from which to 
-            construct a temporal network instance
+            construct a temporal network instance. This can also be an EdgeStore instance, in 
+            which case a columnar temporal network will be constructed.
         @param twopaths: an optional list of two-paths from which to 
             construct a temporal network instance
+        @param columnar: whether or not to keep time-stamped links in a compact, column-oriented 
+            EdgeStore rather than in lists and dictionaries of tuples. For columnar temporal networks, 
+            the index structures tedges, time, targets, sources, activities and ordered_times are only 
+            generated when they are accessed for the first time. In this case, tedges can be any iterable 
+            of links (e.g. Utilities.iterEdges), which is consumed in chunks of bounded size (see 
+            EdgeStore.fromEdges).
+        @param compact: whether or not to only keep the aggregated weights of distinct two-paths 
+            (s,v,d). In compact mode, the index structures twopaths, twopathsByNode, twopathsByTime, 
+            twopathsBySource and twopathsByTarget are only generated when they are accessed.
+        @param workers: the number of processes to use for the extraction of two-paths. For workers > 1, 
+            two-paths are extracted in chunks of the time line by a pool of processes, which yields 
+            exactly the same two-paths as a serial extraction.
         """
         
-        self.tedges = []
-        nodes_seen = defaultdict( lambda:False )
-        self.nodes = []
+        # The columnar storage of time-stamped links, which is only used if columnar=True
+        self.store = None
+
+        if isinstance(tedges, EdgeStore):
+            self.store = tedges
+            columnar = True
+        elif columnar:
+            Log.add('Building columnar edge store ...')
+            self.store = EdgeStore() if tedges is None else EdgeStore.fromEdges(tedges)
+            Log.add('finished.')
 
-        # Generate index structures which help to efficiently extract time-respecting paths
+        """Whether or not time-stamped links are kept in a columnar EdgeStore"""
+        self.columnar = columnar
 
-        # A dictionary storing all time-stamped links, indexed by time-stamps
-        self.time = defaultdict( lambda: list() )
+        if self.columnar:
+            # The dictionary-based index structures below are generated 
+            # on first access (see __getattr__)
+            self.nodes = list(self.store.names)
+        else:
+            self.tedges = []
+            nodes_seen = defaultdict( lambda:False )
+            self.nodes = []
 
-        # A dictionary storing all time-stamped links, indexed by time and target node
-        self.targets = defaultdict( lambda: dict() )
+            # Generate index structures which help to efficiently extract time-respecting paths
 
-        # A dictionary storing all time-stamped links, indexed by time and source node 
-        self.sources = defaultdict( lambda: dict() )
+            # A dictionary storing all time-stamped links, indexed by time-stamps
+            self.time = defaultdict( lambda: list() )
 
-        # A dictionary storing time stamps at which links (v,*;t) originate from node v
-        self.activities = defaultdict( lambda: list() )
+            # A dictionary storing all time-stamped links, indexed by time and target node
+            self.targets = defaultdict( lambda: dict() )
 
-        # A dictionary storing sets of time stamps at which links (v,*;t) originate from node v
-        # Note that the insertion into a set is much faster than repeatedly checking whether 
-        # an element already exists in a list!
-        self.activities_sets = defaultdict( lambda: set() )
+            # A dictionary storing all time-stamped links, indexed by time and source node 
+            self.sources = defaultdict( lambda: dict() )
 
-        # An ordered list of time-stamps
-        self.ordered_times = []
+            # A dictionary storing time stamps at which links (v,*;t) originate from node v
+            self.activities = defaultdict( lambda: list() )
 
-        self.tedges = []
+            # A dictionary storing sets of time stamps at which links (v,*;t) originate from node v
+            # Note that the insertion into a set is much faster than repeatedly checking whether 
+            # an element already exists in a list!
+            self.activities_sets = defaultdict( lambda: set() )
 
-        if tedges is not None:
-            Log.add('Building index data structures ...')
+            # An ordered list of time-stamps
+            self.ordered_times = []
 
-            for e in tedges:
-                self.activities_sets[e[0]].add(e[2])
-                self.time[e[2]].append(e)
-                self.targets[e[2]].setdefault(e[1], []).append(e)
-                self.sources[e[2]].setdefault(e[0], []).append(e)
-                if not nodes_seen[e[0]]:
-                    nodes_seen[e[0]] = True
-                if not nodes_seen[e[1]]:
-                    nodes_seen[e[1]] = True
-            self.tedges = tedges
-            self.nodes = list(nodes_seen.keys())
-            Log.add('finished.')
+            self.tedges = []
 
-            Log.add('Sorting time stamps ...')
+            if tedges is not None:
+                Log.add('Building index data structures ...')
 
-            self.ordered_times = sorted(self.time.keys())
-            for v in self.nodes:
-                self.activities[v] = sorted(self.activities_sets[v])
-            Log.add('finished.')
+                for e in tedges:
+                    self.activities_sets[e[0]].add(e[2])
+                    self.time[e[2]].append(e)
+                    self.targets[e[2]].setdefault(e[1], []).append(e)
+                    self.sources[e[2]].setdefault(e[0], []).append(e)
+                    if not nodes_seen[e[0]]:
+                        nodes_seen[e[0]] = True
+                    if not nodes_seen[e[1]]:
+                        nodes_seen[e[1]] = True
+                self.tedges = tedges
+                self.nodes = list(nodes_seen.keys())
+                Log.add('finished.')
+
+                Log.add('Sorting time stamps ...')
+
+                self.ordered_times = sorted(self.time.keys())
+                for v in self.nodes:
+                    self.activities[v] = sorted(self.activities_sets[v])
+                Log.add('finished.')
 
         # Index structures for two-path structures
         self.twopaths = []
@@ -93,6 +156,25 @@ class TemporalNetwork:
         self.twopathsByTarget = defaultdict( lambda: dict() )
         self.tpcount = -1
 
+        # Cached two-path structures and aggregate networks for values of delta other than the current one
+        self.deltaCache = {}
+
+        # Two-paths extracted for a maximum time difference (max_delta, two-paths), see extractTwoPathSweep
+        self.twopathSweep = None
+
+        # Cached spectral properties of aggregate networks, indexed by (model, delta), see getSpectralCache
+        self.spectralCache = {}
+
+        """Whether or not only aggregated two-path weights are kept after two-path extraction"""
+        self.compact = compact
+
+        """The number of processes to be used for the extraction of two-paths"""
+        self.workers = workers
+
+        # The aggregated weights of distinct two-paths, which are stored as a tuple of 
+        # numpy arrays (s, v, d, weight), where s, v and d are indices of nodes in the list nodes
+        self.twopathWeights = None
+
         """The separator character to be used to generate higher-order nodes"""
         self.separator = sep
 
@@ -127,6 +209,54 @@ class TemporalNetwork:
         self.g2 = 0
         self.g2n = 0
 
+
+    def __getattr__(self, name):
+        """Generates the dictionary-based index structures of a columnar temporal network, 
+        as well as the two-path index structures of a compact temporal network when they 
+        are accessed for the first time. Note that this method is only called if the regular 
+        attribute lookup fails."""
+
+        if self.__dict__.get('compact', False) and name in ('twopaths', 'twopathsByNode', 
+            'twopathsByTime', 'twopathsBySource', 'twopathsByTarget'):
+            if self.tpcount == -1:
+                self.extractTwoPaths()
+            self.indexTwoPaths()
+            return self.__dict__[name]
+
+        if not self.__dict__.get('columnar', False) or name not in ('tedges', 'time', 'targets', 
+            'sources', 'activities', 'activities_sets', 'ordered_times'):
+            raise AttributeError(name)
+
+        if name == 'tedges':
+            value = self.store.getTEdges()
+        elif name == 'time':
+            value = self.store.getTimeDict(self.tedges)
+        elif name == 'targets':
+            value = self.store.getNodeDict(self.tedges, mode='IN')
+        elif name == 'sources':
+            value = self.store.getNodeDict(self.tedges, mode='OUT')
+        elif name == 'activities':
+            value = self.store.getActivities()
+        elif name == 'activities_sets':
+            value = defaultdict( lambda: set() )
+            for v in self.activities:
+                value[v] = set(self.activities[v])
+        else:
+            value = self.store.getOrderedTimes()
+        setattr(self, name, value)
+        return value
+
+
+    def getEdgeStore(self):
+        """Returns an EdgeStore containing all time-stamped links of this temporal network. 
+        For columnar temporal networks, this is the underlying storage. Otherwise, the edge 
+        store is generated from the list of time-stamped links, in which case node ids 
+        correspond to the positions of nodes in the list nodes."""
+
+        if self.store is None:
+            self.store = EdgeStore(self.tedges, nodes=self.nodes)
+        return self.store
+
       
     def filterEdges(self, edge_filter):
         """Allows to filter time-stamped edges according to a given filter expression. 
@@ -146,7 +276,7 @@ class TemporalNetwork:
 
         Log.add('finished. Filtered out ' + str(self.ecount() - len(new_t_edges)) + ' time-stamped edges.', Severity.INFO)
 
-        return TemporalNetwork(sep=self.separator, tedges=new_t_edges)
+        return TemporalNetwork(sep=self.separator, tedges=new_t_edges, columnar=self.columnar, compact=self.compact, workers=self.workers)
 
 
     def filterTwoPaths(self, twopath_filter):
@@ -178,38 +308,168 @@ class TemporalNetwork:
         @param target: name of the target node of a directed, time-stamped link
         @param ts: (integer) time-stamp of the time-stamped link
         """
-        e = (source, target, ts)
-        self.tedges.append(e)
-        if source not in self.nodes:
-            self.nodes.append(source)
-        if target not in self.nodes:
-            self.nodes.append(target)
+        self.addEdges([(source, target, ts)])
 
-        # Add edge to index structures
-        self.time[ts].append(e)
-        self.targets[ts].setdefault(target, []).append(e)
-        self.sources[ts].setdefault(source, []).append(e)
 
-        if ts not in self.activities[source]:
-            self.activities[source].append(ts)
-            self.activities[source].sort()
+    def addEdges(self, tedges):
+        """Adds a sequence of directed time-stamped edges (source,target;time) to the temporal network. 
+        All index structures are updated incrementally. If none of the new edges has a time stamp 
+        smaller than the latest time stamp in the temporal network, cached two-paths as well as the 
+        weights of cached first- and second-order aggregate networks are extended. Otherwise, 
+        they are invalidated.
 
-        # Reorder time stamps
-        self.ordered_times = sorted(self.time.keys())
-        
-        self.InvalidateTwoPaths()
+        @param tedges: a list of directed time-stamped edges (source,target,time)
+        """
+        tedges = list(tedges)
+        if len(tedges) == 0:
+            return
+
+        store = self.getEdgeStore()
+        t_min = min(e[2] for e in tedges)
+
+        # Two-paths cached for other values of delta are not extended
+        self.deltaCache = {}
+        self.twopathSweep = None
+        self.spectralCache = {}
+
+        # Extending cached two-paths is possible if no link precedes any of the existing links
+        extend = self.tpcount >= 0 and store.ecount() > 0 and t_min >= store.times[-1]
+        if extend:
+            # Only two-paths (s,v;t) -> (v,d;t') with t >= t_min - delta are affected by the new links
+            t_from = t_min - self.delta
+            old_tp = store.getTwoPaths(self.delta, t_from=t_from)
+
+        # Add new nodes and edges to the edge store
+        ids = [ (store.getNodeId(e[0]), store.getNodeId(e[1])) for e in tedges ]
+        self.nodes.extend(store.names[len(self.nodes):])
+        store.addEdges([x[0] for x in ids], [x[1] for x in ids], [e[2] for e in tedges])
+
+        # Add edges to index structures. For columnar temporal networks, 
+        # this is only necessary for index structures which have been generated
+        index = self.__dict__
+        for e in tedges:
+            source, target, ts = e[0], e[1], e[2]
+            e = (source, target, ts)
+            if 'tedges' in index:
+                self.tedges.append(e)
+            if 'time' in index:
+                self.time[ts].append(e)
+            if 'targets' in index:
+                self.targets[ts].setdefault(target, []).append(e)
+            if 'sources' in index:
+                self.sources[ts].setdefault(source, []).append(e)
+            if 'activities' in index:
+                activities = self.activities[source]
+                i = bisect_left(activities, ts)
+                if i == len(activities) or activities[i] != ts:
+                    activities.insert(i, ts)
+            if 'activities_sets' in index:
+                self.activities_sets[source].add(ts)
+            if 'ordered_times' in index:
+                i = bisect_left(self.ordered_times, ts)
+                if i == len(self.ordered_times) or self.ordered_times[i] != ts:
+                    self.ordered_times.insert(i, ts)
+
+        if extend:
+            self.extendTwoPaths(old_tp, store.getTwoPaths(self.delta, t_from=t_from), ids)
+        else:
+            self.InvalidateTwoPaths()
+
+
+    def extendTwoPaths(self, old_tp, new_tp, ids):
+        """Updates cached two-paths and aggregate networks after links have been added to the 
+        end of the temporal network. Two-paths old_tp which may have been affected by the new links 
+        are replaced by the two-paths new_tp, which have been extracted after adding the links.
 
+        @param old_tp: tuple of arrays of two-paths extracted before links were added (see EdgeStore.getTwoPaths)
+        @param new_tp: tuple of arrays of two-paths extracted for the same time range after links were added
+        @param ids: list of pairs of node ids of the links which have been added
+        """
+
+        names = self.getEdgeStore().names
+
+        # Update per-instance index structures, which are ordered by time stamps
+        if 'twopathsByNode' in self.__dict__:
+            k = len(old_tp[5])
+            if k > 0:
+                del self.twopaths[-k:]
+            for s, v, d, t in zip(old_tp[0].tolist(), old_tp[1].tolist(), old_tp[2].tolist(), old_tp[3].tolist()):
+                self.twopathsByTime.pop(t, None)
+                for index, x in ((self.twopathsByNode, v), (self.twopathsBySource, s), (self.twopathsByTarget, d)):
+                    if names[x] in index:
+                        index[names[x]].pop(t, None)
+                        if len(index[names[x]]) == 0:
+                            del index[names[x]]
+            self.indexTwoPaths(new_tp, append=True)
+
+        self.tpcount += len(new_tp[5]) - len(old_tp[5])
+
+        # Changes of aggregated two-path weights. Note that adding links 
+        # never removes two-paths, it only changes their weights.
+        s, v, d, w = aggregateTwoPaths(np.concatenate((old_tp[0], new_tp[0])), np.concatenate((old_tp[1], new_tp[1])),
+            np.concatenate((old_tp[2], new_tp[2])), np.concatenate((-old_tp[5], new_tp[5])))
+        tp = self.twopathWeights
+        self.twopathWeights = aggregateTwoPaths(np.concatenate((tp[0], s)), np.concatenate((tp[1], v)),
+            np.concatenate((tp[2], d)), np.concatenate((tp[3], w)))
+
+        if self.g1 != 0:
+            n = self.g1.vcount()
+            if len(self.nodes) > n:
+                self.g1.add_vertices(len(self.nodes)-n, attributes={"name": self.nodes[n:]})
+            if self.g1["all_links"]:
+                addEdgeWeights(self.g1, [x[0] for x in ids], [x[1] for x in ids], np.ones(len(ids), dtype=int))
+            else:
+                addEdgeWeights(self.g1, np.concatenate((s, v)), np.concatenate((v, d)), np.concatenate((w, w)))
 
-    def InvalidateTwoPaths(self):
-        """Invalidates all cached two-paths, as well as any (higher-order) aggregate networks"""
+        if self.g2 != 0:
+            index = dict( (x, i) for i, x in enumerate(zip(self.g2.vs["source"], self.g2.vs["target"])) )
+            n1 = list(zip(s.tolist(), v.tolist()))
+            n2 = list(zip(v.tolist(), d.tolist()))
+            new_vertices = []
+            for x in n1 + n2:
+                if x not in index:
+                    index[x] = len(index)
+                    new_vertices.append(x)
+            if len(new_vertices) > 0:
+                attributes = {"source": [x[0] for x in new_vertices], "target": [x[1] for x in new_vertices]}
+                if "name" in self.g2.vs.attributes():
+                    attributes["name"] = self.getSecondOrderNames(attributes["source"], attributes["target"])
+                self.g2.add_vertices(len(new_vertices), attributes=attributes)
+            addEdgeWeights(self.g2, [ index[x] for x in n1 ], [ index[x] for x in n2 ], w)
+
+        # The null model depends on the stationary distribution of the second-order network
+        self.g2n = 0
+
+
+    def InvalidateTwoPaths(self, all_deltas=True):
+        """Invalidates all cached two-paths, as well as any (higher-order) aggregate networks
+        
+        @param all_deltas: whether to also invalidate two-paths and aggregate networks which have been 
+            cached for other values of the maximum time difference delta (see setMaxTimeDiff), as well as 
+            two-paths extracted by extractTwoPathSweep. If False, only data for the current delta is invalidated.
+        """
+
+        if all_deltas:
+            self.deltaCache = {}
+            self.twopathSweep = None
+            self.spectralCache = {}
+        else:
+            for key in [ key for key in self.spectralCache if key[1] == self.delta ]:
+                del self.spectralCache[key]
         
         # Invalidate indexed data 
         self.tpcount = -1
-        self.twopaths = []
-        self.twopathsByNode = defaultdict( lambda: dict() )
-        self.twopathsByTime = defaultdict( lambda: dict() )
-        self.twopathsBySource = defaultdict( lambda: dict() )
-        self.twopathsByTarget = defaultdict( lambda: dict() )
+        self.twopathWeights = None
+        if self.compact:
+            # Index structures will be regenerated on first access
+            for name in ('twopaths', 'twopathsByNode', 'twopathsByTime', 'twopathsBySource', 'twopathsByTarget'):
+                self.__dict__.pop(name, None)
+        else:
+            self.twopaths = []
+            self.twopathsByNode = defaultdict( lambda: dict() )
+            self.twopathsByTime = defaultdict( lambda: dict() )
+            self.twopathsBySource = defaultdict( lambda: dict() )
+            self.twopathsByTarget = defaultdict( lambda: dict() )
         self.g1 = 0
         self.g2 = 0
         self.g2n = 0
@@ -223,6 +483,8 @@ class TemporalNetwork:
         
     def ecount(self):
         """Returns the number of time-stamped edges (u,v;t) in this temporal network"""
+        if self.columnar:
+            return self.store.ecount()
         return len(self.tedges)
 
     def getObservationLength(self):
@@ -246,9 +508,55 @@ class TemporalNetwork:
         """
         
         if delta != self.delta:
+            # Keep two-path structures for the old value, so switching back is for free
+            if self.tpcount >= 0:
+                self.deltaCache[self.delta] = dict( (name, self.__dict__[name]) for name in ('tpcount', 'twopathWeights', 
+                    'g1', 'g2', 'g2n', 'twopaths', 'twopathsByNode', 'twopathsByTime', 'twopathsBySource', 
+                    'twopathsByTarget') if name in self.__dict__ )
+
             # Set new value and invalidate two-path structures
             self.delta = delta
-            self.InvalidateTwoPaths()
+            spectral = dict( (key, x) for key, x in self.spectralCache.items() if key[1] == delta )
+            self.InvalidateTwoPaths(all_deltas=False)
+
+            # Restore previously cached two-path structures (and their spectral properties) for the new value
+            if delta in self.deltaCache:
+                self.__dict__.update(self.deltaCache.pop(delta))
+                self.spectralCache.update(spectral)
+    
+
+    def extractTwoPathSweep(self, max_delta):
+        """Extracts all two-paths for the maximum time difference max_delta in a single pass, keeping 
+        the waiting time t'-t of each two-path (s,v;t) -> (v,d;t'). Whenever two-paths are subsequently 
+        needed for some delta <= max_delta (see setMaxTimeDiff), they are obtained by filtering 
+        two-paths according to their waiting times, rather than by extracting them again. 
+        Since the weight of a two-path does not depend on delta, this yields exactly the same 
+        two-paths and second-order aggregate networks. This is useful to efficiently study how 
+        measures depend on the time scale delta, e.g. by calling
+
+            t.extractTwoPathSweep(100)
+            for delta in range(1, 101):
+                t.setMaxTimeDiff(delta)
+                print(delta, Measures.SlowDownFactor(t))
+
+        @param max_delta: the maximum time difference for which two-paths will be extracted
+        """
+
+        Log.add('Extracting two-paths for delta <= ' + str(int(max_delta)) + '...')
+        self.twopathSweep = (max_delta, self.getEdgeStore().getTwoPaths(max_delta, workers=self.workers))
+        Log.add('finished.')
+
+
+    def getTwoPathArrays(self):
+        """Returns all two-paths for the current maximum time difference delta as a tuple of 
+        numpy arrays, as returned by EdgeStore.getTwoPaths. If two-paths have been extracted for 
+        a larger delta by extractTwoPathSweep, they will be filtered by their waiting time."""
+
+        if self.twopathSweep is not None and self.delta <= self.twopathSweep[0]:
+            tp = self.twopathSweep[1]
+            mask = tp[4] <= tp[3] + self.delta
+            return tuple( x[mask] for x in tp )
+        return self.getEdgeStore().getTwoPaths(self.delta, workers=self.workers)
     
 
     def getInterEventTimes(self):
@@ -331,67 +639,83 @@ class TemporalNetwork:
 
         Log.add('Extracting two-paths for delta = ' + str(int(self.delta)) + '...')
 
-        self.tpcount = -1
-        self.twopaths = []
-        self.twopathsByNode = defaultdict( lambda: dict() )
-        self.twopathsByTime = defaultdict( lambda: dict() )
-        self.twopathsBySource = defaultdict( lambda: dict() )
+        # Invalidate cached two-paths and aggregate networks
+        self.InvalidateTwoPaths(all_deltas=False)
+
+        # Extract arrays of all two-paths (s,v;t) -> (v,d;t') with t' \in (t, t+delta] 
+        # and their weights 1/(indeg_v*outdeg_v), where indeg_v is the number of links (*,v;t) 
+        # and outdeg_v is the number of links (v,*;t')
+        tp = self.getTwoPathArrays()
+
+        # TODO: Add support for time-stamped links which have link weights w by themselves, i.e. (u,v;t;w)
+
+        self.twopathWeights = aggregateTwoPaths(tp[0], tp[1], tp[2], tp[5])
+        self.tpcount = len(tp[5])
+
+        # In compact mode, index structures are only generated on demand
+        if not self.compact:
+            self.indexTwoPaths(tp)
+
+        Log.add('finished.')
+
+
+    def indexTwoPaths(self, tp=None, append=False):
+        """Generates the index structures twopaths, twopathsByNode, twopathsByTime, 
+        twopathsBySource and twopathsByTarget, which contain one tuple (s,v,d,weight) 
+        for each two-path. For compact temporal networks, this method is called whenever 
+        one of these index structures is accessed for the first time.
+
+        @param tp: an optional tuple of arrays of two-paths, as returned by EdgeStore.getTwoPaths. 
+            If omitted, two-paths will be extracted for the current maximum time difference delta.
+        @param append: whether to add two-paths to the existing index structures rather than 
+            replacing them. Two-paths must not precede any two-path in the existing index.
+        """
+
+        if tp is None:
+            tp = self.getTwoPathArrays()
+        tp_s, tp_v, tp_d, tp_t, tp_future_t, tp_w = tp
+
+        if not append:
+            self.twopaths = []
+            self.twopathsByNode = defaultdict( lambda: dict() )
+            self.twopathsByTime = defaultdict( lambda: dict() )
+            self.twopathsBySource = defaultdict( lambda: dict() )
+            self.twopathsByTarget = defaultdict( lambda: dict() )
 
         # Avoid reevaluations in loop
         tpappend = self.twopaths.append
-        srcs = self.sources
-        tgts = self.targets
-        odts = self.ordered_times
-        dt = self.delta
-
-        # For each time stamp in the ordered list of time stamps
-        for i in range(len(odts)):
-            t = odts[i]
-
-            # For each possible middle node v (i.e. all target nodes at time t) ... 
-            for v in tgts[t]:
-                # Get the minimum and maximum indices of time stamps in the ordered list of "activities" of node v
-                # which continue a time-respecting path, i.e. we are interested in 
-                # the time stamps t' of all links (v,*;t') such that t'  \in (t, t+delta]
-
-                # The minimum index is the index of the smallest time stamp that is larger than t
-                min_ix = bisect_right(self.activities[v], t)
-
-                # The maximum index is the index of the largest time stamp that is smaller or equal than t + delta
-                max_ix = bisect_right(self.activities[v], t+dt)-1
-
-                # For all time-stamped links (v,*;t') with t' \in (t, t+delta] ...
-                for j in range(min_ix, max_ix+1):
-                    future_t = self.activities[v][j]
-                    # For all possible IN-edges at time t that link *to* node v
-                    for e_in in tgts[t][v]:
-                        # Combine with all OUT-edges at time future_t that link *from* v
-                        for e_out in srcs[future_t][v]:
-                            s = e_in[0]
-                            d = e_out[1]
-                            if s != v and v != d:
-                                indeg_v = len(tgts[t][v])
-                                outdeg_v = len(srcs[future_t][v])
-
-                                # Create a weighted two-path tuple
-                                # (s, v, d, weight)
-                                two_path = (s,v,d, float(1)/(indeg_v*outdeg_v))
-
-                                # TODO: Add support for time-stamped links which have link weights w by themselves, i.e. (u,v;t;w)
-
-                                tpappend(two_path)
-                                self.twopathsByNode[v].setdefault(t, []).append(two_path)
-                                self.twopathsByTime[t].setdefault(v, []).append(two_path)
-                                self.twopathsBySource[s].setdefault(t, []).append(two_path)
-                                self.twopathsByTarget[d].setdefault(t, []).append(two_path)
-        
-        self.tpcount = len(self.twopaths)
-
-        # Invalidate cached aggregate networks
-        g1 = 0
-        g2 = 0
-        g2n = 0                
-        Log.add('finished.')
+        names = self.getEdgeStore().names
+
+        for s, v, d, t, w in zip(tp_s.tolist(), tp_v.tolist(), tp_d.tolist(), tp_t.tolist(), tp_w.tolist()):
+            s = names[s]
+            v = names[v]
+            d = names[d]
+
+            # Create a weighted two-path tuple
+            # (s, v, d, weight)
+            two_path = (s,v,d,w)
+            tpappend(two_path)
+            self.twopathsByNode[v].setdefault(t, []).append(two_path)
+            self.twopathsByTime[t].setdefault(v, []).append(two_path)
+            self.twopathsBySource[s].setdefault(t, []).append(two_path)
+            self.twopathsByTarget[d].setdefault(t, []).append(two_path)
+
+
+    def getTwoPathWeights(self):
+        """Returns the aggregated weights of all distinct two-paths (s,v,d) as a tuple of 
+        numpy arrays (s, v, d, weight), where s, v and d are indices of nodes in the list nodes. 
+        If two-paths have not been extracted yet, this will be done now."""
+
+        if self.tpcount == -1:
+            self.extractTwoPaths()
+
+        if self.twopathWeights is None:
+            # Temporal network has been constructed from a list of two-paths
+            index = dict( (v, i) for i, v in enumerate(self.nodes) )
+            self.twopathWeights = aggregateTwoPaths([index[tp[0]] for tp in self.twopaths], 
+                [index[tp[1]] for tp in self.twopaths], [index[tp[2]] for tp in self.twopaths], 
+                [tp[3] for tp in self.twopaths])
+        return self.twopathWeights
 
         
     def TwoPathCount(self):
@@ -428,139 +752,261 @@ class TemporalNetwork:
 
         Log.add('Constructing first-order aggregate network ...')
 
+        # Spectral properties of a previously generated first-order network are invalid
+        self.spectralCache.pop(('FIRSTORDER', self.delta), None)
+
         self.g1 = igraph.Graph(n=len(self.nodes), directed=True)
 
         # Make sure that the ordering of vertices matches that in the nodes list
         self.g1.vs["name"] = self.nodes
 
-        edge_list = {}
+        n = len(self.nodes)
 
         # Consider *all* edges and their (accumulated) weights ... 
         if all_links:
-            for e in self.tedges:
-                edge_list[(e[0], e[1])] = edge_list.get((e[0], e[1]), 0) + 1
+            store = self.getEdgeStore()
+            n = max(n, store.vcount())
+            keys, inverse = np.unique(store.sources.astype(np.int64) * n + store.targets, return_inverse=True)
+            weights = np.bincount(inverse, minlength=len(keys))
 
         # ... or only consider edges contributing to two paths and their (accumulated) weights
-        else:                    
-            for tp in self.twopaths:
-                key1 = (tp[0], tp[1])
-                key2 = (tp[1], tp[2])
-                # get key{1,2} with default value 0 from edge_list directory
-                edge_list[key1] = edge_list.get(key1, 0) + tp[3]
-                edge_list[key2] = edge_list.get(key2, 0) + tp[3]
+        else:
+            s, v, d, w = self.getTwoPathWeights()
+            keys, inverse = np.unique(np.concatenate((s.astype(np.int64) * n + v, v.astype(np.int64) * n + d)), return_inverse=True)
+            weights = np.bincount(inverse, weights=np.concatenate((w, w)), minlength=len(keys))
             
         # adding all edges at once is much faster as igraph updates internal
         # data structures after each vertex/edge added
-        self.g1.add_edges( edge_list.keys() )
-        self.g1.es["weight"] = list(edge_list.values())
+        self.g1.add_edges( list(zip((keys // n).tolist(), (keys % n).tolist())) )
+        self.g1.es["weight"] = weights.tolist()
+        self.g1["all_links"] = all_links
         
         Log.add('finished.')
 
         return self.g1
 
 
-    def igraphSecondOrder(self):
+    def getSecondOrderNames(self, sources, targets):
+        """Returns the names v-w of second-order nodes, which correspond to first-order 
+        links (v,w). Names are generated using the separator character of this temporal network.
+
+        @param sources: a sequence of indices of source nodes v in the list nodes, e.g. the 
+            vertex attribute "source" of a second-order aggregate network
+        @param targets: a sequence of indices of target nodes w in the list nodes, e.g. the 
+            vertex attribute "target" of a second-order aggregate network
+        """
+        sep = self.separator
+        nodes = self.nodes
+        return [ str(nodes[a])+sep+str(nodes[b]) for a, b in zip(sources, targets) ]
+
+
+    def igraphSecondOrder(self, names=True):
         """Returns the second-order time-aggregated network
            corresponding to this temporal network. This network corresponds to 
            a second-order Markov model reproducing both the link statistics and 
            (first-order) order correlations in the underlying temporal network.
+
+           Each second-order node v-w corresponds to a first-order link (v,w). The indices of v 
+           and w in the list nodes (which coincide with the indices of vertices in the first-order 
+           aggregate network) are stored in the vertex attributes "source" and "target".
+
+           @param names: whether or not to generate the vertex attribute "name", which contains 
+                the names v-w of second-order nodes (see getSecondOrderNames)
            """
 
         if self.g2 != 0:
+            if names and not "name" in self.g2.vs.attributes():
+                self.g2.vs["name"] = self.getSecondOrderNames(self.g2.vs["source"], self.g2.vs["target"])
             return self.g2
 
-        if self.tpcount == -1:
-            self.extractTwoPaths()
+        s, v, d, w = self.getTwoPathWeights()
 
         Log.add('Constructing second-order aggregate network ...')
 
-        # create vertex list and edge directory first
-        vertex_list = []
-        edge_dict = {}
-        sep = self.separator
-        for tp in self.twopaths:
-            n1 = str(tp[0])+sep+str(tp[1])
-            n2 = str(tp[1])+sep+str(tp[2])
-            vertex_list.append(n1)
-            vertex_list.append(n2)
-            key = (n1, n2)
-            edge_dict[key] = edge_dict.get(key, 0) + tp[3]
-            
-        # remove duplicate vertices by building a set
-        vertex_list = list(set(vertex_list))
+        # Each distinct two-path (s,v,d) corresponds to an edge between the 
+        # second-order nodes (s,v) and (v,d), so we first find all distinct second-order nodes
+        n = len(self.nodes)
+        keys, inverse = np.unique(np.concatenate((s.astype(np.int64) * n + v, v.astype(np.int64) * n + d)), return_inverse=True)
         
         # build 2nd order graph
-        self.g2 = igraph.Graph( n=len(vertex_list), directed=True )
-        self.g2.vs["name"] = vertex_list
+        self.g2 = igraph.Graph( n=len(keys), directed=True )
+        self.g2.vs["source"] = (keys // n).tolist()
+        self.g2.vs["target"] = (keys % n).tolist()
+        if names:
+            self.g2.vs["name"] = self.getSecondOrderNames(self.g2.vs["source"], self.g2.vs["target"])
         
         # add all edges in one go
-        self.g2.add_edges( edge_dict.keys() )
-        self.g2.es["weight"] = list(edge_dict.values())
+        self.g2.add_edges( list(zip(inverse[:len(w)].tolist(), inverse[len(w):].tolist())) )
+        self.g2.es["weight"] = w.tolist()
 
         Log.add('finished.')
 
         return self.g2
 
 
-    def igraphSecondOrderNull(self):
+    def igraphSecondOrderNull(self, names=True):
         """Returns a second-order null Markov model 
            corresponding to the first-order aggregate network. This network
            is a second-order representation of the weighted time-aggregated network. In order to 
            compute the null model, the strongly connected component of the second-order network 
            needs to have at least two nodes.          
+
+           @param names: whether or not to generate the vertex attribute "name" (see igraphSecondOrder)
            """
         if self.g2n != 0:
+            if names and not "name" in self.g2n.vs.attributes():
+                self.g2n.vs["name"] = self.getSecondOrderNames(self.g2n.vs["source"], self.g2n.vs["target"])
             return self.g2n
 
-        g2 = self.igraphSecondOrder().components(mode='STRONG').giant()
+        g2 = self.getGiantComponent('SECOND')
         n_vertices = len(g2.vs)
 
         if n_vertices<=1:
             Log.add('Strongly connected component is empty for delta = ' + str(self.delta), Severity.ERROR)
             raise EmptySCCError()
         
-        T = RWTransitionMatrix( g2 )
-        pi = StationaryDistribution(T)
+        pi = self.getStationaryDistribution('SECOND')
         
         # Construct null model second-order network
-        self.g2n = igraph.Graph(directed=True)
-
         # This ensures that vertices are ordered in the same way as in the empirical second-order network
-        for v in g2.vs():
-            self.g2n.add_vertex(name=v["name"])
-        
-        ## TODO: This operation is the bottleneck for large data sets. We should only iterate over those edge pairs, that actually are two-paths
-        edge_dict = {}
-        vertices = g2.vs()
-        sep = self.separator
-        for i in range(n_vertices):
-            e1 = vertices[i]
-            e1name = e1["name"]
-            a,b = e1name.split(sep)
-            for j in range(i+1, n_vertices):
-                e2 = vertices[j]
-                e2name = e2["name"]
-                a_,b_ = e2name.split(sep)
-                
-                # Check whether this pair of nodes in the second-order 
-                # network is a *possible* forward two-path
-                if b == a_:
-                    w = np.abs(pi[e2.index])
-                    if w>0:
-                        edge_dict[(e1name, e2name)] = w
-                        
-                if b_ == a:
-                    w = np.abs(pi[e1.index])
-                    if w>0:
-                        edge_dict[(e2name, e1name)] = w
-        
-        # add all edges to the graph in one go
-        self.g2n.add_edges( edge_dict.keys() )
-        self.g2n.es["weight"] = list(edge_dict.values())
+        self.g2n = igraph.Graph(n=n_vertices, directed=True)
+        self.g2n.vs["source"] = g2.vs["source"]
+        self.g2n.vs["target"] = g2.vs["target"]
+        if names:
+            self.g2n.vs["name"] = self.getSecondOrderNames(g2.vs["source"], g2.vs["target"])
+
+        # First-order nodes a and b of all second-order nodes (a,b)
+        a = np.array(g2.vs["source"], dtype=int)
+        b = np.array(g2.vs["target"], dtype=int)
+
+        # Group second-order nodes (b,c) by their first node b, so that for each node (a,b) all 
+        # possible forward two-paths (a,b) -> (b,c) are given by a contiguous range of nodes
+        order = np.argsort(a, kind='stable')
+        start = np.searchsorted(a[order], b, 'left')
+        stop = np.searchsorted(a[order], b, 'right')
+        n = stop - start
+        i = np.repeat(np.arange(n_vertices), n)
+        j = order[start[i] + np.arange(len(i)) - (np.cumsum(n) - n)[i]]
+
+        # Each edge (a,b) -> (b,c) is weighted by the stationary probability of node (b,c)
+        w = np.abs(pi[j])
+        mask = (i != j) & (w > 0)
+        i, j, w = i[mask], j[mask], w[mask]
+
+        # add all edges to the graph in one go (in the order of pairs of node indices)
+        order = np.lexsort((i > j, np.maximum(i, j), np.minimum(i, j)))
+        self.g2n.add_edges( list(zip(i[order].tolist(), j[order].tolist())) )
+        self.g2n.es["weight"] = w[order].tolist()
         
         return self.g2n
 
 
+    def getSpectralCache(self, model='SECOND'):
+        """Returns a dictionary which caches spectral properties of the strongly connected giant 
+        component of the second-order (model='SECOND'), second-order null (model='NULL') or 
+        first-order (model='FIRSTORDER') aggregate network for the current maximum time difference 
+        delta. Cached values are shared between all measures computed for this temporal network, 
+        and they are invalidated whenever the underlying aggregate networks are invalidated 
+        (see InvalidateTwoPaths). 
+
+        @param model: either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}
+        """
+        assert model == 'SECOND' or model == 'NULL' or model == 'FIRSTORDER'
+
+        return self.spectralCache.setdefault((model, self.delta), {})
+
+
+    def getGiantComponent(self, model='SECOND'):
+        """Returns the (cached) strongly connected giant component of the second-order (model='SECOND'), 
+        second-order null (model='NULL') or first-order (model='FIRSTORDER') aggregate network. 
+        Note that the returned graph must not be modified.
+
+        @param model: either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}
+        """
+        cache = self.getSpectralCache(model)
+        if 'giant' not in cache:
+            if model == 'SECOND':
+                g = self.igraphSecondOrder(names=False)
+            elif model == 'NULL':
+                g = self.igraphSecondOrderNull(names=False)
+            else:
+                g = self.igraphFirstOrder()
+            cache['giant'] = g.components(mode='STRONG').giant()
+        return cache['giant']
+
+
+    def getTransitionMatrix(self, model='SECOND'):
+        """Returns the (cached) transposed random walk transition matrix of the strongly connected 
+        giant component of the given model (see getGiantComponent and Utilities.RWTransitionMatrix). 
+        Note that the returned matrix must not be modified.
+
+        @param model: either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}
+        """
+        cache = self.getSpectralCache(model)
+        if 'T' not in cache:
+            cache['T'] = RWTransitionMatrix( self.getGiantComponent(model) )
+        return cache['T']
+
+
+    def getStationaryDistribution(self, model='SECOND'):
+        """Returns the (cached) stationary distribution of the random walk transition matrix 
+        of the given model (see getTransitionMatrix and Utilities.StationaryDistribution). 
+        Note that the returned array must not be modified.
+
+        @param model: either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}
+        """
+        cache = self.getSpectralCache(model)
+        if 'pi' not in cache:
+            cache['pi'] = StationaryDistribution( self.getTransitionMatrix(model) )
+        return cache['pi']
+
+
+    def getLeadingEigenvalues(self, model='SECOND'):
+        """Returns the (cached) two eigenvalues with largest magnitude of the random walk 
+        transition matrix of the given model (see getTransitionMatrix).
+
+        @param model: either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}
+        """
+        cache = self.getSpectralCache(model)
+        if 'evals' not in cache:
+            # NOTE: ncv=13 sets additional auxiliary eigenvectors that are computed
+            # NOTE: in order to be more confident to find the one with the largest
+            # NOTE: magnitude, see
+            # NOTE: https://github.com/scipy/scipy/issues/4987
+            cache['evals'] = sla.eigs( self.getTransitionMatrix(model), which="LM", k=2, ncv=13, return_eigenvectors=False )
+        return cache['evals']
+
+
+    def getLaplacian(self, model='SECOND'):
+        """Returns the (cached) transposed Laplacian matrix I-T of the given model, where T is 
+        the transposed random walk transition matrix (see getTransitionMatrix). 
+        Note that the returned matrix must not be modified.
+
+        @param model: either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}
+        """
+        cache = self.getSpectralCache(model)
+        if 'L' not in cache:
+            T = self.getTransitionMatrix(model)
+            cache['L'] = sparse.identity( T.shape[0] ) - T
+        return cache['L']
+
+
+    def getLaplacianEigenvalues(self, model='SECOND'):
+        """Returns the (cached) two eigenvalues with smallest magnitude of the Laplacian matrix 
+        of the given model (see getLaplacian).
+
+        @param model: either C{"SECOND"}, C{"NULL"} or C{"FIRSTORDER"}
+        """
+        cache = self.getSpectralCache(model)
+        if 'L_evals' not in cache:
+            # NOTE: ncv=13 sets additional auxiliary eigenvectors that are computed
+            # NOTE: in order to be more confident to find the one with the largest
+            # NOTE: magnitude, see
+            # NOTE: https://github.com/scipy/scipy/issues/4987
+            cache['L_evals'] = sla.eigs( self.getLaplacian(model), which="SM", k=2, ncv=13, return_eigenvectors=False )
+        return cache['L_evals']
+
+
     def ShuffleEdges(self, l=0, with_replacement=True):        
         """Generates a shuffled version of the temporal network in which edge statistics (i.e.
         the frequencies of time-stamped edges) are preserved, while all order correlations are 
@@ -6,7 +6,15 @@ Created on Wed Jul 15 10:48:48 2015
 (c) Copyright ETH Zürich, Chair of Systems Design, 2015
 """
 
+import io
+import os
+import re
 import sys
+import bz2
+import gzip
+import lzma
+import calendar
+import multiprocessing
 import numpy as np
 import scipy.sparse as sparse
 import scipy.sparse.linalg as sla
@@ -18,11 +26,13 @@ import itertools
 import pyTempNet as tn
 import datetime as dt
 
+from pyTempNet.EdgeStore import EdgeStore
+
 from pyTempNet.Log import *
 
 import sys
 
-def readFile(filename, sep=',', fformat="TEDGE", timestampformat="%s", maxlines=sys.maxsize):
+def readFile(filename, sep=',', fformat="TEDGE", timestampformat="%s", maxlines=sys.maxsize, columnar=False, workers=1, chunk_size=2**24, rebase=False, binsize=1):
     """ Reads time-stamped edges from TEDGE or TRIGRAM file. If fformat is TEDGES,
         the file is expected to contain lines in the format 'v,w,t' each line 
         representing a directed time-stamped link from v to w at time t.
@@ -31,14 +41,29 @@ def readFile(filename, sep=',', fformat="TEDGE", timestampformat="%s", maxlines=
         If fformat is TRIGRAM the file is expected to contain lines in the format
         'u,v,w' each line representing a time-respecting path (u,v) -> (v,w) consisting 
         of two consecutive links (u,v) and (v,w). Timestamps can be integer numbers or
-        string timestamps (in which case the timestampformat string is used for parsing)
+        string timestamps (in which case the timestampformat string is used for parsing).
+        TEDGE files are parsed in large chunks of bytes (see readTEdges). Files can be plain text 
+        or compressed by gzip, bz2 or xz, where compressed files are parsed by a single process.
+
+        @param timestampformat: the format of time stamps, as used by datetime.strptime. Time stamps 
+            consisting of digits are always read as integers. For the default "%s", all other time 
+            stamps are parsed as ISO 8601 dates (e.g. "2015-01-01 10:00"). Dates are converted to 
+            seconds since the epoch, where dates without time zone are taken as UTC.
+        @param columnar: whether or not to construct a columnar temporal network, whose 
+            EdgeStore is generated directly from the parsed arrays (default False)
+        @param workers: the number of processes used to parse TEDGE files. For workers > 1, 
+            the file is split into byte ranges which are parsed by a pool of processes.
+        @param chunk_size: the number of bytes of a TEDGE file parsed at once (default 16 MB)
+        @param rebase: whether or not to subtract the earliest time stamp from all time stamps, 
+            such that time starts at zero (default False). Negative time stamps are kept in this case.
+        @param binsize: the number of time units (e.g. seconds) combined into one integer tick. 
+            Time stamps t are replaced by t // binsize, after rebasing (default 1)
     """
     
     assert filename is not ""
     assert (fformat is "TEDGE") or (fformat is "TRIGRAM")
     
-    with open(filename, 'r') as f:
-        tedges = []
+    with openFile(filename, 'rt') as f:
         twopaths = []
         
         header = f.readline()
@@ -51,14 +76,7 @@ def readFile(filename, sep=',', fformat="TEDGE", timestampformat="%s", maxlines=
         weight_ix = -1
         target_ix = -1
         if fformat =="TEDGE":
-            for i in range(len(header)):
-                header[i] = header[i].strip()
-                if header[i] == 'node1' or header[i] == 'source':
-                    source_ix = i
-                elif header[i] == 'node2' or header[i] == 'target':
-                    target_ix = i
-                elif header[i] == 'time' or header[i] == 'timestamp':
-                    time_ix = i
+            source_ix, target_ix, time_ix = getTEdgeColumns(header)
         elif fformat =="TRIGRAM":
             # For trigram files, we assume a default of (unweighted) trigrams in the form source;mid;target
             # Any other ordering, as well as the additional inclusion of weights requires the definition of 
@@ -84,35 +102,16 @@ def readFile(filename, sep=',', fformat="TEDGE", timestampformat="%s", maxlines=
             Log.add('No time stamps found in data, assuming consecutive links', Severity.WARNING)
         
         # Read time-stamped links
-        if fformat == "TEDGES":
+        if fformat == "TEDGE":
             Log.add('Reading time-stamped links ...')
         else:
             Log.add('Reading trigram data ...')
 
-        line = f.readline()
-        n = 1 
-        while line and n <= maxlines:
-            fields = line.rstrip().split(sep)
-            if fformat =="TEDGE":
-                try:
-                    if time_ix >=0:
-                        timestamp = fields[time_ix]            
-                        if timestamp.isdigit():
-                            t = int(timestamp)
-                        else:
-                            x = dt.datetime.strptime(timestamp, "%Y-%m-%d %H:%M")
-                            t = int(time.mktime(x.timetuple()))
-                    else:
-                        t = n                
-                    if t>=0:
-                        tedge = (fields[source_ix], fields[target_ix], t)
-                        tedges.append(tedge)
-                    else:
-                        Log.add('Ignoring negative timestamp in line ' + str(n+1) + ': "' + line.strip() + '"', Severity.WARNING)
-                except (IndexError, ValueError):
-                    Log.add('Ignoring malformed data in line ' + str(n+1) + ': "' +  line.strip() + '"', Severity.WARNING)
-
-            elif fformat =="TRIGRAM":
+        if fformat =="TRIGRAM":
+            line = f.readline()
+            n = 1 
+            while line and n <= maxlines:
+                fields = line.rstrip().split(sep)
                 source = fields[source_ix].strip('"')
                 mid = fields[mid_ix].strip('"')
                 target = fields[target_ix].strip('"')
@@ -123,14 +122,24 @@ def readFile(filename, sep=',', fformat="TEDGE", timestampformat="%s", maxlines=
                 tp = (source, mid, target, weight)
                 twopaths.append(tp)
 
-            line = f.readline()
-            n += 1
+                line = f.readline()
+                n += 1
     # end of with open()
     
-    Log.add('finished.')
-    if fformat == "TEDGE":        
+    if fformat == "TEDGE":
+        names, sources, targets, times = readTEdges(filename, sep, source_ix, target_ix, time_ix, maxlines, workers, chunk_size, 
+            timestampformat, rebase)
+        if time_ix >= 0 and len(times) > 0:
+            origin = times.min() if rebase else 0
+            times = (times - origin) // binsize
+        Log.add('finished.')
+        if columnar:
+            return tn.TemporalNetwork(tedges = EdgeStore.fromArrays(sources, targets, times, names), sep=sep)
+        names = np.array(names, dtype=object)
+        tedges = list(zip(names[sources].tolist(), names[targets].tolist(), times.tolist()))
         return tn.TemporalNetwork(tedges = tedges, sep=sep)
     elif fformat =="TRIGRAM":
+        Log.add('finished.')
         # If trigram data did not contain a weight column, we aggregate
         # multiple occurrences to weighted trigrams
         if weight_ix < 0:            
@@ -146,6 +155,478 @@ def readFile(filename, sep=',', fformat="TEDGE", timestampformat="%s", maxlines=
         return tn.TemporalNetwork(twopaths = twopaths, sep=sep)
 
 
+def openFile(filename, mode='rb'):
+    """Opens a file which is either plain or compressed by gzip, bz2 or xz. The compression is 
+    detected from the first bytes of the file.
+
+    @param filename: the name of the file
+    @param mode: the mode in which the file is opened, either 'rb' or 'rt'
+    """
+    with open(filename, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith(b'\x1f\x8b'):
+        return gzip.open(filename, mode)
+    elif magic.startswith(b'BZh'):
+        return bz2.open(filename, mode)
+    elif magic.startswith(b'\xfd7zXZ\x00'):
+        return lzma.open(filename, mode)
+    return open(filename, 'r' if mode == 'rt' else mode)
+
+
+def getTEdgeColumns(header):
+    """Returns a tuple (source_ix, target_ix, time_ix) with the columns of source nodes, target 
+    nodes and time stamps in the header of a TEDGE file. Columns which are not found are -1.
+
+    @param header: the list of column names
+    """
+    source_ix = -1
+    target_ix = -1
+    time_ix = -1
+    for i in range(len(header)):
+        header[i] = header[i].strip()
+        if header[i] == 'node1' or header[i] == 'source':
+            source_ix = i
+        elif header[i] == 'node2' or header[i] == 'target':
+            target_ix = i
+        elif header[i] == 'time' or header[i] == 'timestamp':
+            time_ix = i
+    return source_ix, target_ix, time_ix
+
+
+def iterEdges(filename, sep=',', timestampformat="%s", maxlines=sys.maxsize, chunk_size=2**24):
+    """Generates the time-stamped edges (v,w,t) of a TEDGE file one by one, in the order of lines. 
+    The file can be plain text or compressed by gzip, bz2 or xz. Lines are read and parsed in 
+    blocks of chunk_size bytes (see parseTEdgeChunk), such that the memory used does not depend 
+    on the size of the file. Header columns and time stamps are handled as by readFile, and 
+    malformed lines are skipped. A columnar temporal network can be constructed from the 
+    generated edges in bounded memory (see EdgeStore.fromEdges).
+
+    @param filename: the name of the TEDGE file
+    @param sep: the separator of columns
+    @param timestampformat: the format of time stamps (see readFile)
+    @param maxlines: the maximum number of lines to read (excluding the header)
+    @param chunk_size: the number of bytes parsed at once (default 16 MB)
+    """
+
+    with openFile(filename) as f:
+        header = f.readline().decode('utf-8').split(sep)
+        source_ix, target_ix, time_ix = getTEdgeColumns(header)
+        assert source_ix >= 0 and target_ix >= 0, "Detected invalid header columns: %s" % header
+        if time_ix<0:
+            Log.add('No time stamps found in data, assuming consecutive links', Severity.WARNING)
+
+        cache = {}
+        rest = b''
+        n = 0
+        while n < maxlines:
+            block = f.read(chunk_size)
+            data = rest + block
+            rest = b''
+            if len(block) > 0:
+                cut = data.rfind(b'\n') + 1
+                data, rest = data[:cut], data[cut:]
+                if cut == 0:
+                    continue
+            elif len(data) == 0:
+                break
+
+            names, src, tgt, ts, lines, bad, nlines = parseTEdgeChunk(data, sep, source_ix, target_ix, time_ix, 
+                timestampformat, False, cache)
+            keep = lines < maxlines - n
+            if time_ix < 0:
+                ts = lines + n + 1
+            logBadLines(bad, n, maxlines)
+            names = np.array(names, dtype=object)
+            for e in zip(names[src[keep]].tolist(), names[tgt[keep]].tolist(), ts[keep].tolist()):
+                yield e
+            n += nlines
+
+
+def logBadLines(bad, offset=0, maxlines=sys.maxsize):
+    """Logs warnings for the malformed lines and lines with negative time stamps returned by 
+    parseTEdgeChunk, whose line numbers are shifted by offset. Lines beyond maxlines are ignored."""
+    for line, negative, text in bad:
+        if line + offset < maxlines:
+            if negative:
+                Log.add('Ignoring negative timestamp in line ' + str(line+offset+2) + ': "' + text + '"', Severity.WARNING)
+            else:
+                Log.add('Ignoring malformed data in line ' + str(line+offset+2) + ': "' + text + '"', Severity.WARNING)
+
+
+def readTEdges(filename, sep, source_ix, target_ix, time_ix=-1, maxlines=sys.maxsize, workers=1, chunk_size=2**24, 
+    timestampformat="%s", allow_negative=False):
+    """Reads the time-stamped edges in all lines following the header line of a TEDGE file. 
+    This returns a tuple (names, sources, targets, times), where names is the list of node names 
+    in the order of their first appearance, sources and targets are arrays of indices in names, and 
+    edges are ordered as the lines of the file. Lines are parsed in chunks of bytes (see 
+    parseTEdgeChunk). For workers > 1, the file is split into byte ranges at line boundaries, 
+    which are parsed by a pool of processes (see readTEdgeRange). Compressed files are always 
+    parsed by a single process.
+
+    @param filename: the name of the TEDGE file
+    @param sep: the separator of columns
+    @param source_ix: the column of source nodes
+    @param target_ix: the column of target nodes
+    @param time_ix: the column of time stamps. If negative, the number of a line is used as time stamp.
+    @param maxlines: the maximum number of lines to read (excluding the header)
+    @param workers: the number of processes
+    @param chunk_size: the number of bytes parsed at once
+    @param timestampformat: the format of time stamps (see parseTimeColumn)
+    @param allow_negative: whether or not to keep edges with negative time stamps
+    """
+
+    with openFile(filename) as f:
+        f.readline()
+        bounds = [f.tell()]
+        compressed = not isinstance(f, io.BufferedReader)
+        size = sys.maxsize if compressed else os.fstat(f.fileno()).st_size
+        if workers > 1 and not compressed:
+            for k in range(1, workers):
+                f.seek(bounds[0] + k * (size - bounds[0]) // workers)
+                f.readline()
+                bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(max(size, bounds[-1]))
+    chunks = [ (filename, a, b, sep, source_ix, target_ix, time_ix, maxlines, chunk_size, timestampformat, allow_negative) for a, b in zip(bounds[:-1], bounds[1:]) if b > a ]
+
+    if len(chunks) > 1:
+        Log.add('Parsing ' + str(len(chunks)) + ' byte ranges using ' + str(workers) + ' processes ...')
+        pool = multiprocessing.Pool(len(chunks))
+        try:
+            parts = pool.map(readTEdgeRange, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        parts = [ readTEdgeRange(chunk) for chunk in chunks ]
+
+    # Merge the node names of all byte ranges, and shift line numbers by the lines of preceding ranges
+    names = []
+    ids = {}
+    sources = []
+    targets = []
+    times = []
+    n = 0
+    for names_r, src, tgt, ts, lines, bad, nlines in parts:
+        keep = lines < maxlines - n
+        names_r = names_r[:max(src[keep].max(initial=-1), tgt[keep].max(initial=-1)) + 1]
+        for v in names_r:
+            if v not in ids:
+                ids[v] = len(names)
+                names.append(v)
+        mapping = np.array([ ids[v] for v in names_r ], dtype=np.int32)
+        sources.append(mapping[src[keep]])
+        targets.append(mapping[tgt[keep]])
+        times.append(lines[keep] + n + 1 if time_ix < 0 else ts[keep])
+        logBadLines(bad, n, maxlines)
+        n += nlines
+
+    if len(parts) == 0:
+        return names, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+    return names, np.concatenate(sources), np.concatenate(targets), np.concatenate(times)
+
+
+def readTEdgeRange(chunk):
+    """Parses the lines in a byte range of a TEDGE file, which is read in blocks of chunk_size bytes. 
+    The chunk is a tuple (filename, start, end, sep, source_ix, target_ix, time_ix, maxlines, chunk_size, 
+    timestampformat, allow_negative), where start and end must be positions at line boundaries. Returns 
+    a tuple as parseTEdgeChunk, where node indices refer to the node names of the whole range and line 
+    numbers start at zero. Parsed string timestamps are cached across blocks."""
+
+    filename, start, end, sep, source_ix, target_ix, time_ix, maxlines, chunk_size, timestampformat, allow_negative = chunk
+    names = []
+    ids = {}
+    cache = {}
+    parts = []
+    bad = []
+    n = 0
+    rest = b''
+    with openFile(filename) as f:
+        f.seek(start)
+        pos = start
+        while pos < end and n < maxlines:
+            block = f.read(min(chunk_size, end - pos))
+            pos += len(block)
+
+            # Only parse complete lines, and keep the remainder for the next block
+            data = rest + block
+            rest = b''
+            if pos < end and len(block) > 0:
+                cut = data.rfind(b'\n') + 1
+                data, rest = data[:cut], data[cut:]
+                if cut == 0:
+                    continue
+            elif len(data) == 0:
+                break
+
+            names_c, src, tgt, ts, lines, bad_c, nlines = parseTEdgeChunk(data, sep, source_ix, target_ix, time_ix, 
+                timestampformat, allow_negative, cache)
+            if n + nlines > maxlines:
+                nlines = maxlines - n
+                keep = lines < nlines
+                src, tgt, ts, lines = src[keep], tgt[keep], ts[keep], lines[keep]
+                bad_c = [ x for x in bad_c if x[0] < nlines ]
+                # Names are ordered by first appearance, so the remaining lines use a prefix of them
+                names_c = names_c[:max(src.max(initial=-1), tgt.max(initial=-1)) + 1]
+
+            for v in names_c:
+                if v not in ids:
+                    ids[v] = len(names)
+                    names.append(v)
+            mapping = np.array([ ids[v] for v in names_c ], dtype=np.int32)
+            parts.append( (mapping[src], mapping[tgt], ts, lines + n) )
+            bad += [ (line + n, negative, text) for line, negative, text in bad_c ]
+            n += nlines
+
+    if len(parts) == 0:
+        empty = np.zeros(0, dtype=np.int32)
+        return names, empty, empty, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), bad, n
+    return (names,) + tuple(np.concatenate([ p[k] for p in parts ]) for k in range(4)) + (bad, n)
+
+
+"""Lookup table of the bytes which are removed from the end of lines (as by str.rstrip)"""
+whitespaceBytes = np.zeros(256, dtype=bool)
+whitespaceBytes[[ord(c) for c in ' \t\r\x0b\x0c']] = True
+
+
+def parseTEdgeChunk(data, sep, source_ix, target_ix, time_ix=-1, timestampformat="%s", allow_negative=False, cache=None):
+    """Parses the lines of time-stamped edges contained in a bytes object. Lines are split into 
+    columns by means of vectorized operations on the byte positions of newlines and separators, 
+    and node names are interned to indices (see internStrings). This 
+    returns a tuple (names, sources, targets, times, lines, bad, nlines), where names is the list 
+    of node names in the order of their first appearance, sources, targets and times are arrays 
+    of the edges in all valid lines, whose line numbers are contained in the array lines. bad is 
+    a list of tuples (line, negative, text) for all lines which are malformed or have a negative 
+    timestamp, and nlines is the number of lines. If time_ix < 0, all times are zero.
+
+    @param data: bytes object containing complete lines
+    @param sep: the separator of columns
+    @param source_ix: the column of source nodes
+    @param target_ix: the column of target nodes
+    @param time_ix: the column of time stamps
+    @param timestampformat: the format of time stamps (see parseTimeColumn)
+    @param allow_negative: whether or not to keep edges with negative time stamps
+    @param cache: an optional dictionary of parsed string timestamps (see parseTimeColumn)
+    """
+
+    if len(data) > 0 and not data.endswith(b'\n'):
+        data += b'\n'
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == 10)
+    nlines = len(newlines)
+    starts = np.concatenate(([0], newlines + 1))[:nlines]
+    ends = newlines.copy()
+
+    # Remove trailing whitespace from all lines
+    stripped = (ends > starts) & whitespaceBytes[buf[ends-1]]
+    while stripped.any():
+        ends[stripped] -= 1
+        stripped[stripped] = (ends[stripped] > starts[stripped]) & whitespaceBytes[buf[ends[stripped]-1]]
+
+    # Positions of separators, and the line they belong to
+    sep = sep.encode('utf-8')
+    L = len(sep)
+    is_sep = buf[:len(buf)-L+1] == sep[0]
+    for k in range(1, L):
+        is_sep &= buf[k:len(buf)-L+1+k] == sep[k]
+    seps = np.flatnonzero(is_sep)
+    line_of_sep = np.searchsorted(newlines, seps, 'left')
+    keep = line_of_sep < nlines
+    keep[keep] = seps[keep] + L <= ends[line_of_sep[keep]]
+    seps = seps[keep]
+    line_of_sep = line_of_sep[keep]
+    first_sep = np.searchsorted(line_of_sep, np.arange(nlines), 'left')
+    nsep = np.bincount(line_of_sep, minlength=nlines)
+
+    # Lines which contain all required columns
+    valid = nsep >= max(source_ix, target_ix, time_ix)
+    lines = np.flatnonzero(valid)
+    padded = np.append(seps, 0)
+
+    def getColumn(i):
+        """Returns the byte ranges of column i in all valid lines"""
+        s = starts[lines] if i == 0 else padded[first_sep[lines] + i - 1] + L
+        e = np.where(nsep[lines] > i, padded[np.minimum(first_sep[lines] + i, len(seps))], ends[lines])
+        return s, e
+
+    times = np.zeros(len(lines), dtype=np.int64)
+    negative = np.zeros(len(lines), dtype=bool)
+    if time_ix >= 0:
+        times, parsed = parseTimeColumn(buf, *getColumn(time_ix), timestampformat=timestampformat, cache=cache)
+        if not allow_negative:
+            negative = parsed & (times < 0)
+        valid[lines[~parsed]] = False
+
+    bad = [ (i, False, data[starts[i]:ends[i]].decode('utf-8', 'replace').strip()) for i in np.flatnonzero(~valid).tolist() ]
+    bad += [ (i, True, data[starts[i]:ends[i]].decode('utf-8', 'replace').strip()) for i in lines[negative].tolist() ]
+    bad.sort()
+
+    valid[lines[negative]] = False
+    ok = valid[lines]
+    times = times[ok]
+    lines = lines[ok]
+
+    # Intern node names in the order of their first appearance as source or target
+    s_src, e_src = getColumn(source_ix)
+    s_tgt, e_tgt = getColumn(target_ix)
+    s = np.column_stack((s_src, s_tgt)).ravel()
+    e = np.column_stack((e_src, e_tgt)).ravel()
+    unique, first, inverse = internStrings(getByteMatrix(buf, s, e))
+    order = np.argsort(first, kind='stable')
+    rank = np.zeros(len(unique), dtype=np.int32)
+    rank[order] = np.arange(len(unique), dtype=np.int32)
+    ids = rank[inverse].reshape(-1, 2)
+    names = np.char.decode(unique[order], 'utf-8').tolist() if len(unique) > 0 else []
+
+    return names, ids[:,0], ids[:,1], times, lines, bad, nlines
+
+
+def getByteMatrix(buf, starts, ends):
+    """Returns a matrix of bytes whose i-th row contains the bytes buf[starts[i]:ends[i]], padded 
+    with zeros to a number of columns which is a multiple of eight"""
+    width = int((ends - starts).max()) if len(starts) > 0 else 0
+    width = max(-(-width // 8) * 8, 8)
+    M = np.zeros((len(starts), width), dtype=np.uint8)
+    for k in range(width):
+        inside = np.flatnonzero(starts + k < ends)
+        if len(inside) == 0:
+            break
+        M[inside,k] = buf[starts[inside] + k]
+    return M
+
+
+def internStrings(M):
+    """Finds the distinct rows of a byte matrix as returned by getByteMatrix. Rows are compared 
+    via 64-bit keys, which are identical to the bytes of strings with up to eight bytes, and hash 
+    values of longer strings. Hash collisions are detected, in which case the rows are compared 
+    as strings. This returns a tuple (unique, first, inverse), where unique is an array of the 
+    distinct byte strings, first the index of their first occurrence and inverse the index of 
+    each row in unique."""
+    words = np.ascontiguousarray(M).view(np.uint64)
+    keys = words[:,0].copy()
+    for j in range(1, words.shape[1]):
+        keys *= np.uint64(0x9E3779B97F4A7C15)
+        keys ^= words[:,j]
+    first, inverse = groupKeys(keys)
+    strings = np.ascontiguousarray(M).view('S' + str(M.shape[1])).ravel()
+    if words.shape[1] > 1 and not (M == M[first[inverse]]).all():
+        first, inverse = groupKeys(strings)
+    return strings[first], first, inverse
+
+
+def groupKeys(keys):
+    """Returns a tuple (first, inverse) of arrays, where first contains the index of the first 
+    occurrence of each distinct key (in the order of sorted keys), and inverse the index of the 
+    distinct key of each element"""
+    order = np.argsort(keys)
+    if len(keys) == 0:
+        return order, order
+    sorted_keys = keys[order]
+    new = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+    inverse = np.empty(len(keys), dtype=np.int64)
+    inverse[order] = np.cumsum(new) - 1
+    return np.minimum.reduceat(order, np.flatnonzero(new)), inverse
+
+
+def parseTimeColumn(buf, starts, ends, timestampformat="%s", cache=None):
+    """Parses the time stamps contained in the byte ranges starts[i]:ends[i] of buf. Strings of 
+    digits are converted to integers by vectorized operations, irrespective of the format. All other 
+    time stamps are parsed once for each distinct string (see parseTimestamps). This returns a 
+    tuple (times, parsed) of an integer array and a boolean array indicating valid time stamps.
+
+    @param timestampformat: the format of time stamps (see readFile)
+    @param cache: an optional dictionary which maps strings to tuples (time, parsed). Results for 
+        strings contained in the cache are reused, and new results are added to it.
+    """
+
+    times = np.zeros(len(starts), dtype=np.int64)
+    width = int((ends - starts).max()) if len(starts) > 0 else 0
+    parsed = ends > starts
+    for k in range(width):
+        inside = np.flatnonzero(starts + k < ends)
+        digits = buf[starts[inside] + k] - np.uint8(48)
+        parsed[inside[digits > 9]] = False
+        times[inside] = times[inside] * 10 + digits
+
+    other = np.flatnonzero(~parsed)
+    if len(other) > 0:
+        unique, first, inverse = internStrings(getByteMatrix(buf, starts[other], ends[other]))
+        strings = np.char.decode(unique, 'utf-8', 'replace').tolist()
+        if cache is None:
+            cache = {}
+        missing = [ x for x in strings if x not in cache ]
+        ts, ok = parseTimestamps(missing, timestampformat)
+        for x, t, p in zip(missing, ts.tolist(), ok.tolist()):
+            cache[x] = (t, p)
+        results = [ cache[x] for x in strings ]
+        times[other] = np.array([ x[0] for x in results ], dtype=np.int64)[inverse]
+        parsed[other] = np.array([ x[1] for x in results ], dtype=bool)[inverse]
+        # Limit the size of caches for data with many distinct time stamps
+        if len(cache) > 2**20:
+            cache.clear()
+    return times, parsed
+
+
+"""Regular expressions of the ISO 8601 formats of time stamps which are parsed by numpy.datetime64"""
+isoFormats = dict( (f, re.compile(f.replace('%Y', '[0-9]{4}').replace('%m', '[0-9]{2}').replace('%d', '[0-9]{2}')
+    .replace('%H', '[0-9]{2}').replace('%M', '[0-9]{2}').replace('%S', '[0-9]{2}'))) for f in 
+    ["%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"] )
+
+
+def parseTimestamps(timestamps, timestampformat="%s"):
+    """Converts a list of string timestamps to seconds since the epoch, where timestamps without 
+    time zone are taken as UTC. Timestamps which have the shape of an ISO 8601 format, i.e. the 
+    same digit and separator positions, are converted at once via numpy.datetime64. All other 
+    timestamps are parsed by datetime.strptime. This returns a tuple (times, parsed) of an integer 
+    array and a boolean array indicating valid time stamps.
+
+    @param timestamps: list of timestamps
+    @param timestampformat: the format of timestamps. For "%s", timestamps are expected to 
+        have the shape of one of the ISO 8601 formats in isoFormats.
+    """
+    times = np.zeros(len(timestamps), dtype=np.int64)
+    parsed = np.zeros(len(timestamps), dtype=bool)
+    if timestampformat == "%s":
+        patterns = list(isoFormats.values())
+    else:
+        patterns = [ isoFormats[timestampformat] ] if timestampformat in isoFormats else []
+    iso = np.array([ any(p.fullmatch(x) for p in patterns) for x in timestamps ], dtype=bool)
+
+    ix = np.flatnonzero(iso)
+    if len(ix) > 0:
+        try:
+            x = np.array([ timestamps[i] for i in ix ], dtype='datetime64[s]')
+            times[ix] = x.astype(np.int64)
+            parsed[ix] = ~np.isnat(x)
+        except ValueError:
+            # Invalid dates such as month 13, which are parsed one by one below
+            iso[:] = False
+
+    for i, timestamp in enumerate(timestamps):
+        if iso[i] or timestampformat == "%s" and not any(p.fullmatch(timestamp) for p in patterns):
+            continue
+        try:
+            if timestampformat == "%s":
+                x = np.datetime64(timestamp, 's')
+                if not np.isnat(x):
+                    times[i] = x.astype(np.int64)
+                    parsed[i] = True
+            else:
+                times[i] = calendar.timegm(dt.datetime.strptime(timestamp, timestampformat).utctimetuple())
+                parsed[i] = True
+        except (ValueError, OverflowError):
+            pass
+    return times, parsed
+
+
+def getEdgeArray( graph ):
+    """Returns a numpy array with shape (m, 2), which contains the source and target 
+    vertex indices of all m edges of the given graph in the order of the edge sequence.
+
+    @param graph: the graph
+    """
+    return np.fromiter(itertools.chain.from_iterable(graph.get_edgelist()), dtype=int, count=2*graph.ecount()).reshape(-1, 2)
+
+
 def getSparseAdjacencyMatrix( graph, attribute=None, transposed=False ):
     """Returns a sparse adjacency matrix of the given graph.
     
@@ -160,34 +641,18 @@ def getSparseAdjacencyMatrix( graph, attribute=None, transposed=False ):
     if (attribute is not None) and (attribute not in graph.es.attribute_names()):
       raise ValueError( "Attribute does not exists." )
     
-    row = []
-    col = []
-    data = []
-    
+    # Build matrix in bulk from the edge list
+    edges = getEdgeArray(graph)
+    if transposed:
+      row, col = edges[:,1], edges[:,0]
+    else:
+      row, col = edges[:,0], edges[:,1]
+
     if attribute is None:
-      if transposed:
-        for edge in graph.es():
-          s,t = edge.tuple
-          row.append(t)
-          col.append(s)
-      else:
-        for edge in graph.es():
-          s,t = edge.tuple
-          row.append(s)
-          col.append(t)
-      data = np.ones(len(graph.es()))
+      data = np.ones(len(edges))
     else:
-      if transposed:
-        for edge in graph.es():
-            s,t = edge.tuple
-            row.append(t)
-            col.append(s)
-      else:
-        for edge in graph.es():
-            s,t = edge.tuple
-            row.append(s)
-            col.append(t)
-      data = np.array(graph.es()[attribute])
+      data = np.array(graph.es[attribute])
+      data = data.reshape(data.size,)
 
     return sparse.coo_matrix((data, (row, col)) , shape=(len(graph.vs), len(graph.vs))).tocsr()
 
@@ -197,37 +662,25 @@ def RWTransitionMatrix(g):
     and directed network
     
     @param g: the graph"""
-    row = []
-    col = []
-    data = []
+    # Build matrix in bulk from the edge list, where each edge (s,t) 
+    # is stored at position (t,s) of the transposed matrix
+    edges = getEdgeArray(g)
+    row = edges[:,1]
+    col = edges[:,0]
     if g.is_weighted():
-      D = g.strength(mode='out', weights=g.es["weight"])
-      for edge in g.es():
-          s,t = edge.tuple
-          row.append(t)
-          col.append(s)
-          tmp = edge["weight"] / D[s]
-          if tmp <0 or tmp > 1:
-              tn.Log.add('Encountered transition probability outside [0,1] range.', Severity.ERROR)
-              raise ValueError()
-          data.append( tmp )
+      D = np.array(g.strength(mode='out', weights="weight"))
+      # TODO: find out why weights are some times of type (N, 1)
+      # TODO: and sometimes of type (N,). The latter is desired
+      # TODO: otherwise scipy.coo will raise a ValueError
+      weights = np.array(g.es["weight"], dtype=float)
+      data = weights.reshape(weights.size,) / D[col]
     else:
-      D = g.degree(mode='out')
-      for edge in g.es():
-          s,t = edge.tuple
-          row.append(t)
-          col.append(s)
-          tmp = 1. / D[s]
-          if tmp <0 or tmp > 1:
-              tn.Log.add('Encountered transition probability outside [0,1] range.', Severity.ERROR)
-              raise ValueError()
-          data.append( tmp )
-    
-    # TODO: find out why data is some times of type (N, 1)
-    # TODO: and sometimes of type (N,). The latter is desired
-    # TODO: otherwise scipy.coo will raise a ValueError
-    data = np.array(data)
-    data = data.reshape(data.size,)
+      D = np.array(g.degree(mode='out'), dtype=float)
+      data = 1. / D[col]
+
+    if np.any((data < 0) | (data > 1)):
+      tn.Log.add('Encountered transition probability outside [0,1] range.', Severity.ERROR)
+      raise ValueError()
 
     return sparse.coo_matrix((data, (row, col)), shape=(len(g.vs), len(g.vs))).tocsr()   
 
@@ -279,12 +732,39 @@ def StationaryDistribution( T, normalize=True ):
         pi /= sum(pi)
     return pi
 
-def getPossibleTwoPaths(edges):
-    """Returns the list of different two-paths that can be constructed from edges""" 
-    twopaths = [tp for tp in itertools.combinations(edges, 2) if tp[0][1] == tp[1][0]]
+def getPossibleTwoPaths(edges, self_loops=True):
+    """Returns the list of different two-paths ((u,v), (v,w)) that can be constructed from 
+    (distinct) edges. Note that this requires time O(E^2) for E edges. Its length is identical 
+    to the number returned by countPossibleTwoPaths, which should be used unless the actual 
+    two-paths are needed (e.g. for validation).
+
+    @param edges: an iterable of edges (v,w)
+    @param self_loops: whether or not to consider two-paths which contain self-loops (v,v)
+    """ 
+    edges = set(edges)
+    if not self_loops:
+        edges = set(e for e in edges if e[0] != e[1])
+    twopaths = [tp for tp in itertools.product(edges, repeat=2) if tp[0][1] == tp[1][0]]
     return twopaths
 
 
+def countPossibleTwoPaths(edges, self_loops=True):
+    """Returns the number of different two-paths ((u,v), (v,w)) that can be constructed 
+    from (distinct) edges. This number is computed in time O(E) as the sum of in-degree 
+    times out-degree of all nodes v in the network of distinct edges.
+
+    @param edges: an iterable of edges (v,w)
+    @param self_loops: whether or not to consider two-paths which contain self-loops (v,v)
+    """ 
+    indeg = defaultdict( lambda: 0 )
+    outdeg = defaultdict( lambda: 0 )
+    for e in set(edges):
+        if self_loops or e[0] != e[1]:
+            outdeg[e[0]] += 1
+            indeg[e[1]] += 1
+    return sum(indeg[v] * outdeg[v] for v in indeg)
+
+
 def firstOrderNameMap( t ):
     """returns a name map of the first order network of a given temporal network t"""
 
@@ -1,4 +1,5 @@
 ﻿from .TemporalNetwork import *
+from .EdgeStore import *
 from .Processes import *
 from .Measures import *
 from .TimeSlices import *